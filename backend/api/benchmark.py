@@ -0,0 +1,293 @@
+"""Нагрузочный прогон основных запросов API.
+
+Данные создаются в тестовой базе (`seed()`), запросы выполняются в том же
+процессе через `APIClient` по очереди (`run()`). Для каждого запроса
+считаются задержки, число и время SQL-запросов - через `RequestTimings`
+из `api.timing`. Случайные параметры запросов зависят только от `seed`,
+поэтому прогоны разных коммитов на одинаковых настройках сравнимы.
+"""
+import random
+import statistics
+import time
+from collections import Counter
+
+import webcolors
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, IsFavoriteRecipe, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from users.models import Follow, User
+from .timing import RequestTimings
+
+WORDS = (
+    'курица', 'говядина', 'рис', 'картофель', 'морковь', 'лук', 'чеснок',
+    'томат', 'сыр', 'молоко', 'мука', 'яйцо', 'масло', 'сливки', 'грибы',
+    'перец', 'капуста', 'свекла', 'фасоль', 'яблоко', 'лимон', 'укроп',
+)
+COLORS = sorted(webcolors.CSS3_NAMES_TO_HEX)
+BATCH_SIZE = 2000
+
+
+class Dataset:
+    """Созданные данные, из которых выбираются параметры запросов.
+
+    `links` - связи клиентов с рецептами по действию (`favorite`,
+    `shopping_cart`) в виде пар (номер клиента, id рецепта); запросы
+    `toggle()` поддерживают их в соответствии с базой.
+    """
+
+    def __init__(self, clients, recipe_ids, tag_slugs, ingredient_ids,
+                 links):
+        self.clients = clients
+        self.recipe_ids = recipe_ids
+        self.tag_slugs = tag_slugs
+        self.ingredient_ids = ingredient_ids
+        self.links = links
+
+
+def seed(users=200, recipes=5000, ingredients=500, tags=10,
+         recipe_ingredients=8, clients=10, follows=20, favorites=50,
+         cart=10, random_seed=0):
+    """Наполняет базу массовыми вставками и возвращает `Dataset`.
+
+    `clients` первых пользователей получают токены, подписки, избранное
+    и корзину - от их имени идут запросы.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(None)
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'user{index}', email=f'user{index}@example.com',
+                first_name='Имя', last_name='Фамилия', password=password
+            )
+            for index in range(users)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тэг {index}', color=COLORS[index], slug=f'tag{index}')
+        for index in range(tags)
+    )
+    tag_ids = list(Tag.objects.values_list('pk', flat=True))
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(
+                name=f'{WORDS[index % len(WORDS)]} {index}',
+                measurement_unit='г'
+            )
+            for index in range(ingredients)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                name=' '.join(rng.sample(WORDS, 3)),
+                text=' '.join(rng.choices(WORDS, k=30)),
+                author_id=rng.choice(user_ids),
+                cooking_time=rng.randint(1, 180)
+            )
+            for _ in range(recipes)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, min(len(tag_ids), 2))
+        ),
+        batch_size=BATCH_SIZE
+    )
+    # Популярность ингредиентов убывает по закону Ципфа, как в жизни.
+    weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in set(rng.choices(
+                ingredient_ids, weights, k=recipe_ingredients
+            ))
+        ),
+        batch_size=BATCH_SIZE
+    )
+    Recipe.objects.update_search_vector()
+    client_ids = user_ids[:clients]
+    followers = Counter()
+    follow_rows = []
+    for user_id in client_ids:
+        for following_id in rng.sample(user_ids, min(follows, users)):
+            if following_id != user_id:
+                follow_rows.append(
+                    Follow(user_id=user_id, following_id=following_id)
+                )
+                followers[following_id] += 1
+    Follow.objects.bulk_create(follow_rows)
+    for following_id, count in followers.items():
+        User.objects.filter(pk=following_id).update(followers_count=count)
+    result = []
+    links = {'favorite': set(), 'shopping_cart': set()}
+    for index, user in enumerate(User.objects.filter(pk__in=client_ids)):
+        links['favorite'].update(
+            (index, recipe_id)
+            for recipe_id in IsFavoriteRecipe.objects.add_recipes(
+                user, rng.sample(recipe_ids, min(favorites, recipes))
+            )
+        )
+        links['shopping_cart'].update(
+            (index, recipe_id)
+            for recipe_id in ShoppingCart.objects.add_recipes(
+                user, rng.sample(recipe_ids, min(cart, recipes))
+            )
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        result.append(client)
+    return Dataset(
+        result, recipe_ids,
+        list(Tag.objects.values_list('slug', flat=True)), ingredient_ids,
+        links
+    )
+
+
+def toggle(action):
+    """Запрос, добавляющий связь с рецептом или удаляющий уже созданную,
+    в том числе при наполнении базы."""
+    def request(data, rng):
+        index = rng.randrange(len(data.clients))
+        client = data.clients[index]
+        recipe_id = rng.choice(data.recipe_ids[:100])
+        url = f'/api/recipes/{recipe_id}/{action}/'
+        key = (index, recipe_id)
+        links = data.links[action]
+        if key in links:
+            links.discard(key)
+            return client.delete(url)
+        links.add(key)
+        return client.post(url)
+    return request
+
+
+def get(path, params=None, anonymous=False):
+    """Запрос GET от имени случайного пользователя или анонима."""
+    def request(data, rng):
+        client = APIClient() if anonymous else rng.choice(data.clients)
+        return client.get(
+            path(data, rng) if callable(path) else path,
+            params(data, rng) if params else None
+        )
+    return request
+
+
+ENDPOINTS = {
+    'recipe_list': get(
+        '/api/recipes/', lambda data, rng: {'page': rng.randint(1, 10)},
+        anonymous=True
+    ),
+    'recipe_list_auth': get(
+        '/api/recipes/', lambda data, rng: {'page': rng.randint(1, 10)}
+    ),
+    'recipe_list_cursor': get(
+        '/api/recipes/', lambda data, rng: {'pagination': 'cursor'}
+    ),
+    'recipe_detail': get(
+        lambda data, rng: f'/api/recipes/{rng.choice(data.recipe_ids)}/'
+    ),
+    'recipe_list_tags': get('/api/recipes/', lambda data, rng: {
+        'tags': rng.sample(data.tag_slugs, min(2, len(data.tag_slugs))),
+    }),
+    'recipe_list_favorited': get(
+        '/api/recipes/', lambda data, rng: {'is_favorited': 1}
+    ),
+    'recipe_list_in_cart': get(
+        '/api/recipes/', lambda data, rng: {'is_in_shopping_cart': 1}
+    ),
+    'recipe_list_popular': get(
+        '/api/recipes/', lambda data, rng: {'ordering': '-favorites_count'}
+    ),
+    'recipe_search': get('/api/recipes/', lambda data, rng: {
+        'search': ' '.join(rng.sample(WORDS, 2)),
+    }),
+    'recipe_list_pantry': get('/api/recipes/', lambda data, rng: {
+        'pantry': rng.sample(data.ingredient_ids[:40], 20),
+        'max_missing': 3,
+    }),
+    'favorite_toggle': toggle('favorite'),
+    'shopping_cart_toggle': toggle('shopping_cart'),
+    'download_shopping_cart': get(
+        '/api/recipes/download_shopping_cart/',
+        lambda data, rng: {'format': 'txt'}
+    ),
+    'subscriptions': get(
+        '/api/users/subscriptions/', lambda data, rng: {'recipes_limit': 3}
+    ),
+    'ingredient_search': get('/api/ingredients/', lambda data, rng: {
+        'name': rng.choice(WORDS)[:rng.randint(1, 4)],
+    }),
+}
+
+
+def percentile(values, percent):
+    """Процентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+def execute(request, data, rng):
+    """Выполняет запрос и дочитывает потоковый ответ."""
+    timings = RequestTimings()
+    with connection.execute_wrapper(timings):
+        started = time.perf_counter()
+        response = request(data, rng)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    return response.status_code, elapsed, timings
+
+
+def run(data, endpoints=None, requests=200, warmup=20, random_seed=0):
+    """Прогоняет запросы и возвращает сводку по каждому из них."""
+    result = {}
+    for name in endpoints or ENDPOINTS:
+        request = ENDPOINTS[name]
+        rng = random.Random(f'{random_seed}:{name}')
+        for _ in range(warmup):
+            execute(request, data, rng)
+        latencies, queries, db_times, errors = [], [], [], 0
+        for _ in range(requests):
+            status, elapsed, timings = execute(request, data, rng)
+            errors += status >= 400
+            latencies.append(elapsed * 1000)
+            queries.append(timings.queries)
+            db_times.append(timings.db * 1000)
+        result[name] = {
+            'requests': requests,
+            'errors': errors,
+            'throughput_rps': round(requests / (sum(latencies) / 1000), 1),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 3),
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(max(latencies), 3),
+            },
+            'queries': {
+                'mean': round(statistics.mean(queries), 2),
+                'max': max(queries),
+            },
+            'db_ms_mean': round(statistics.mean(db_times), 3),
+        }
+    return result
@@ -0,0 +1,95 @@
+"""Кэш карточек рецептов.
+
+Тело карточки (`RecipeSerializer` без признаков, зависящих от пользователя)
+одинаково для всех и хранится в кэше по ключу из id рецепта и его версии.
+Признаки `is_favorited` и `is_in_shopping_cart` подставляются поверх тела
+из аннотаций страницы рецептов, `author.is_subscribed` - из резолвера
+подписок запроса.
+Сброс версии выполняется обработчиками из `api.signals`.
+
+В ключ карточки входит и `Recipe.updated_at`: все изменения, влияющие на
+карточку, обновляют его в базе, поэтому карточка устаревает и тогда, когда
+сброс версии не дошел до кэша сервера - например, из команды manage.py
+при кэше в памяти процесса.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
+from recipes.models import Recipe
+from .subscriptions import get_subscription_resolver
+
+VERSION_KEY = 'recipe-card-version:{}'
+CARD_KEY = 'recipe-card:{}:{}:{}:{}'
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает версии карточек рецептов с переданными id."""
+    cache.delete_many([VERSION_KEY.format(pk) for pk in recipe_ids])
+
+
+def get_versions(recipe_ids):
+    """Возвращает текущие версии карточек, заводя недостающие."""
+    keys = {pk: VERSION_KEY.format(pk) for pk in recipe_ids}
+    found = cache.get_many(keys.values())
+    versions = {}
+    missing = {}
+    for pk, key in keys.items():
+        if key in found:
+            versions[pk] = found[key]
+        else:
+            versions[pk] = missing[key] = uuid4().hex
+    if missing:
+        cache.set_many(missing, settings.RECIPE_CARD_CACHE_TIMEOUT)
+    return versions
+
+
+def build_cards(recipe_ids, request):
+    """Сериализует общую часть карточек рецептов одним набором запросов."""
+    from .serializers import RecipeSerializer
+
+    recipes = Recipe.objects.for_user(AnonymousUser()).filter(
+        pk__in=recipe_ids
+    )
+    data = RecipeSerializer(
+        recipes, many=True, context={'request': request}
+    ).data
+    return {card['id']: card for card in data}
+
+
+def get_recipe_cards(recipes, request):
+    """Возвращает карточки рецептов из кэша с признаками пользователя.
+
+    Рецепты должны быть получены через `with_user_flags()` вместе
+    с `updated_at`.
+    """
+    host = request.get_host()
+    versions = get_versions([recipe.pk for recipe in recipes])
+    keys = {
+        recipe.pk: CARD_KEY.format(
+            host, recipe.pk, recipe.updated_at.timestamp(),
+            versions[recipe.pk]
+        )
+        for recipe in recipes
+    }
+    cards = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cards]
+    if missing:
+        built = build_cards(missing, request)
+        new_cards = {keys[pk]: card for pk, card in built.items()}
+        cache.set_many(new_cards, settings.RECIPE_CARD_CACHE_TIMEOUT)
+        cards.update(new_cards)
+    resolver = get_subscription_resolver(request)
+    result = []
+    for recipe in recipes:
+        card = dict(cards[keys[recipe.pk]])
+        card['author'] = dict(
+            card['author'],
+            is_subscribed=resolver.is_subscribed(recipe.author_id)
+        )
+        card['is_favorited'] = recipe.is_favorited
+        card['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        result.append(card)
+    return result
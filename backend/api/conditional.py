@@ -0,0 +1,69 @@
+"""Условные GET-запросы.
+
+Ответы справочников и рецепта получают слабый ETag, рецепт для анонимных
+пользователей - еще и Last-Modified. Если клиент прислал актуальные
+`If-None-Match`/`If-Modified-Since`, возвращается 304 без сериализации.
+Версия тэгов хранится в кэше и сбрасывается обработчиками из
+`api.signals`, версия каталога ингредиентов - в базе с копией в кэше
+(см. `api.search`).
+"""
+import hashlib
+from calendar import timegm
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .search import get_version
+
+TAGS_VERSION_KEY = 'tag-catalog-version'
+
+
+def get_tags_version():
+    """Возвращает текущую версию списка тэгов."""
+    return get_version(TAGS_VERSION_KEY)
+
+
+def invalidate_tags():
+    """Сбрасывает версию списка тэгов."""
+    cache.delete(TAGS_VERSION_KEY)
+
+
+def make_etag(*parts):
+    """Собирает слабый ETag из частей, от которых зависит ответ."""
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def conditional_response(request, build_response, etag,
+                         last_modified=None, vary=()):
+    """Возвращает 304, если версия клиента актуальна, иначе ответ
+    `build_response()`. В обоих случаях проставляет ETag и Last-Modified.
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = build_response()
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
+
+
+class CatalogConditionalMixin:
+    """Условные ответы справочника с ETag из `get_catalog_version()`."""
+
+    def get_catalog_version(self):
+        raise NotImplementedError
+
+    def conditional(self, request, build_response):
+        return conditional_response(
+            request, build_response,
+            make_etag(self.basename, self.get_catalog_version())
+        )
@@ -1,38 +1,147 @@
-from django_filters.rest_framework import BooleanFilter, CharFilter, FilterSet
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters.rest_framework import (BooleanFilter, CharFilter,
+                                           ChoiceFilter, Filter, FilterSet,
+                                           NumberFilter)
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Recipe, RecipeIngredient
+from .search import filter_by_ingredients, search_recipes
+
+TAGS_ANY = 'any'
+TAGS_ALL = 'all'
+
+
+class MultipleValueField(forms.Field):
+    """Список значений повторяющегося параметра: `?tags=a&tags=b`."""
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [item for item in value or () if item]
+
+
+class MultipleIntegerField(MultipleValueField):
+    """Список id из повторяющегося параметра: `?pantry=1&pantry=2`."""
+
+    def to_python(self, value):
+        try:
+            return [int(item) for item in super().to_python(value)]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Укажите id ингредиентов числами.')
+
+
+class MultipleValueFilter(Filter):
+    field_class = MultipleValueField
+
+
+class MultipleIntegerFilter(Filter):
+    field_class = MultipleIntegerField
 
 
 class RecipeFilter(FilterSet):
 
-    tags = CharFilter(field_name="tags__slug")
+    tags = MultipleValueFilter(method='get_tags')
+    tags_match = ChoiceFilter(
+        choices=(
+            (TAGS_ANY, 'Любой из тэгов'),
+            (TAGS_ALL, 'Все тэги'),
+        ),
+        method='skip'
+    )
     is_favorited = BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='get_is_in_shopping_cart')
+    search = CharFilter(method='get_search')
+    ingredients = MultipleIntegerFilter(method='skip')
+    exclude_ingredients = MultipleIntegerFilter(method='skip')
+    pantry = MultipleIntegerFilter(method='skip')
+    max_missing = NumberFilter(method='skip', min_value=0)
+    ordering = ChoiceFilter(
+        choices=(('-favorites_count', 'Популярные'),),
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'tags_match',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ingredients',
+            'exclude_ingredients',
+            'pantry',
+            'max_missing',
+            'ordering'
+        )
+
+    def filter_queryset(self, queryset):
+        return self.filter_ingredients(
+            super().filter_queryset(queryset), self.form.cleaned_data
+        )
+
+    def filter_ingredients(self, queryset, data):
+        """Подбор по составу: `ingredients` - обязательные, `pantry` -
+        имеющиеся, `max_missing` - сколько ингредиентов можно докупить,
+        `exclude_ingredients` - недопустимые.
+
+        Если задано что-то кроме исключений, рецепты подбираются
+        по индексу состава и сортируются по доле имеющихся ингредиентов;
+        в выдачу попадают не больше `RECIPE_SEARCH_LIMIT` лучших из
+        прошедших остальные фильтры.
+        Одни исключения - это NOT EXISTS по составу рецепта.
+        """
+        required = data.get('ingredients') or ()
+        excluded = data.get('exclude_ingredients') or ()
+        pantry = data.get('pantry') or ()
+        max_missing = data.get('max_missing')
+        if required or pantry or max_missing is not None:
+            return filter_by_ingredients(
+                queryset, required, excluded, pantry,
+                None if max_missing is None else int(max_missing)
+            )
+        if excluded:
+            return queryset.exclude(Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient_id__in=excluded
+            )))
+        return queryset
+
+    def get_tags(self, queryset, name, value):
+        """Рецепты с любым (по умолчанию) или со всеми тэгами из списка.
+
+        Каждое условие - EXISTS по индексу (tag_id, recipe_id) таблицы
+        связей, поэтому строки рецептов не дублируются и DISTINCT
+        не нужен.
+        """
+        tags = Recipe.tags.through.objects.filter(recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_match') == TAGS_ALL:
+            for slug in set(value):
+                queryset = queryset.filter(
+                    Exists(tags.filter(tag__slug=slug))
+                )
+            return queryset
+        return queryset.filter(Exists(tags.filter(tag__slug__in=value)))
+
+    def skip(self, queryset, name, value):
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
-            if value:
-                return queryset.filter(is_favorite__user=self.request.user)
-            return queryset.exclude(is_favorite__user=self.request.user)
+            return queryset.with_user_flags(self.request.user).filter(
+                is_favorited=value
+            )
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated:
-            if value:
-                return queryset.filter(
-                    in_shopping_cart__user=self.request.user
-                )
-            return queryset.exclude(in_shopping_cart__user=self.request.user)
+            return queryset.with_user_flags(self.request.user).filter(
+                is_in_shopping_cart=value
+            )
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
-class IngredientFilter(FilterSet):
-    name = CharFilter(lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(value, '-pub_date', '-id')
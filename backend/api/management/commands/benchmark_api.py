@@ -0,0 +1,135 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmark import COLORS, ENDPOINTS, run, seed
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+DATASET_OPTIONS = (
+    'users', 'recipes', 'ingredients', 'tags', 'recipe_ingredients',
+    'clients', 'follows', 'favorites', 'cart',
+)
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a test database and report latency, throughput and query '
+        'counts of the main API endpoints as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--recipe-ingredients', type=int, default=8,
+            help='Ingredients drawn for each recipe'
+        )
+        parser.add_argument(
+            '--clients', type=int, default=10,
+            help='Users sending authenticated requests'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Subscriptions of each client'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=50,
+            help='Favorite recipes of each client'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=10,
+            help='Recipes in the shopping cart of each client'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Measured requests per endpoint'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=20,
+            help='Unmeasured requests per endpoint before measuring'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--endpoint', action='append', choices=list(ENDPOINTS),
+            dest='endpoints', help='Run only these endpoints'
+        )
+        parser.add_argument(
+            '--output', help='Write the report to this file, not stdout'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive',
+            help='Destroy an existing test database without asking'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        if options['clients'] < 1 or options['clients'] > options['users']:
+            raise CommandError('--clients must be between 1 and --users')
+        if options['tags'] > len(COLORS):
+            raise CommandError(f'--tags must not exceed {len(COLORS)}')
+        dataset = {name: options[name] for name in DATASET_OPTIONS}
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=not options['interactive'],
+            serialize=False
+        )
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                started = time.perf_counter()
+                data = seed(random_seed=options['seed'], **dataset)
+                seeded = time.perf_counter() - started
+                endpoints = run(
+                    data, options['endpoints'], options['requests'],
+                    options['warmup'], options['seed']
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        report = json.dumps({
+            'meta': {
+                'commit': get_commit(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'dataset': dataset,
+                'seed_seconds': round(seeded, 2),
+            },
+            'endpoints': endpoints,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
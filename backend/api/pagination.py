@@ -1,5 +1,100 @@
-from rest_framework.pagination import PageNumberPagination
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, PageNumberPagination)
+
+CURSOR_MODE = 'cursor'
+MAX_CURSOR_PAGE_SIZE = 100
 
 
 class FollowPagination(PageNumberPagination):
     page_size_query_param = 'recipes_limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная выдача рецептов по индексу (-pub_date, -id) без COUNT и
+    OFFSET."""
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = MAX_CURSOR_PAGE_SIZE
+
+
+class RecipePagination(BasePagination):
+    """Выбирает способ пагинации рецептов для каждого запроса.
+
+    По умолчанию - постраничная выдача, как раньше. С параметром
+    `?pagination=cursor` (или с `cursor` из ссылки `next`) - курсорная,
+    но только для порядка (-pub_date, -id): выдача, отсортированная
+    по релевантности, доле ингредиентов или популярности, остается
+    постраничной, чтобы курсор не пересортировал ее.
+    """
+
+    def get_paginator(self, request, queryset):
+        if (
+            request.query_params.get('pagination') == CURSOR_MODE
+            or RecipeCursorPagination.cursor_query_param
+            in request.query_params
+        ) and tuple(
+            queryset.query.order_by or queryset.model._meta.ordering
+        ) == RecipeCursorPagination.ordering:
+            return RecipeCursorPagination()
+        return PageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request, queryset)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return PageNumberPagination().get_schema_operation_parameters(view)
+
+
+class FeedPagination(CursorPagination):
+    """Курсорная выдача ленты подписок.
+
+    Страницу строит `TimelineEntry.objects.page()`, курсор хранит позицию
+    (дата, id рецепта) последней записи. Листать можно только вперед.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = MAX_CURSOR_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        positions = queryset.page(
+            request.user, self.page_size + 1,
+            self.parse_position(cursor.position) if cursor else None
+        )
+        self.has_next = len(positions) > self.page_size
+        self.has_previous = False
+        self.page = positions[:self.page_size]
+        return [recipe_id for _, recipe_id in self.page]
+
+    def parse_position(self, position):
+        try:
+            pub_date, recipe_id = position.split('|')
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        pub_date, recipe_id = self.page[-1]
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=f'{pub_date.isoformat()}|{recipe_id}'
+        ))
+
+    def get_previous_link(self):
+        return None
@@ -0,0 +1,116 @@
+"""Прием картинки рецепта в multipart/form-data.
+
+Картинка пишется во временный файл частями по `chunk_size` байт, поэтому
+память на загрузку не зависит от размера картинки. Размер запроса,
+заявленный тип и сигнатура файла проверяются до чтения тела целиком.
+Поля формы `tags` и `ingredients` принимаются как JSON-строки или как
+повторяющиеся поля формы.
+"""
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoParser
+from django.http.multipartparser import MultiPartParserError
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+IMAGE_FIELD = 'image'
+IMAGE_TYPES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/webp': (b'RIFF',),
+}
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер картинки превышает допустимый.'
+    default_code = 'request_too_large'
+
+
+class UnsupportedImage(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Поддерживаются картинки JPEG, PNG, GIF и WebP.'
+    default_code = 'unsupported_image'
+
+
+class FormData(dict):
+    """Поля формы, к которым DRF добавляет файлы через `update()`."""
+
+    def copy(self):
+        return FormData(self)
+
+    def update(self, other):
+        if isinstance(other, MultiValueDict):
+            other = other.items()
+        super().update(other)
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет картинку во временный файл, проверяя ограничения по ходу."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > (
+            settings.RECIPE_IMAGE_MAX_SIZE
+            + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        ):
+            raise RequestTooLarge()
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        if field_name != IMAGE_FIELD or content_type not in IMAGE_TYPES:
+            raise UnsupportedImage()
+        super().new_file(
+            field_name, file_name, content_type, *args, **kwargs
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not raw_data.startswith(
+            IMAGE_TYPES[self.content_type]
+        ):
+            raise UnsupportedImage()
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise RequestTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """Разбирает форму рецепта с картинкой файлом."""
+
+    list_fields = ('tags', 'ingredients')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        handlers = [RecipeImageUploadHandler(request._request)]
+        try:
+            form, files = DjangoParser(
+                meta, stream, handlers, encoding
+            ).parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Multipart form parse error - {exc}')
+        data = FormData()
+        for key, values in form.lists():
+            values = [self.decode(value) for value in values]
+            if key in self.list_fields:
+                data[key] = [
+                    item for value in values
+                    for item in (value if isinstance(value, list) else [value])
+                ]
+            else:
+                data[key] = values[-1]
+        return DataAndFiles(data, files)
+
+    def decode(self, value):
+        if value[:1] in ('[', '{'):
+            try:
+                return json.loads(value)
+            except ValueError:
+                pass
+        return value
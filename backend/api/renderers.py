@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются по одной через `stream()`, чтобы ответ можно было
+    передавать в `StreamingHttpResponse`.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return json.dumps(data, ensure_ascii=False).encode(self.charset)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class ShoppingListTxtRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield 'Ваш список покупок:\n'
+        for ingredient in ingredients:
+            yield (
+                f'{ingredient["ingredient__name"]} '
+                f'{ingredient["amount"]} '
+                f'{ingredient["ingredient__measurement_unit"]}\n'
+            )
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'amount', 'measurement_unit'))
+        for ingredient in ingredients:
+            writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        yield '['
+        separator = ''
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'amount': ingredient['amount'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']'
@@ -0,0 +1,407 @@
+"""Поиск ингредиентов и рецептов.
+
+Ингредиенты ищутся по индексу в памяти процесса. Индекс строится при первом
+обращении и перестраивается, когда меняется версия каталога ингредиентов
+в `CatalogVersion` (её увеличивают обработчики из `api.signals` и команда
+`load_ingredients`). Версия хранится в базе, а ее копия - в общем кэше
+на `INGREDIENT_CATALOG_VERSION_TIMEOUT` секунд, так что автодополнение
+обходится без запросов к базе. После фиксации изменения копия
+сбрасывается; с кэшем в памяти процесса другие процессы увидят новую
+версию не позже чем через этот срок.
+
+Рецепты на PostgreSQL ищутся полнотекстовым поиском по `search_vector`,
+на SQLite - по обратному индексу в памяти процесса.
+
+Для подбора рецептов по ингредиентам в памяти процесса держится индекс
+состава: списки рецептов по каждому ингредиенту и число ингредиентов
+рецепта. Он перестраивается не чаще раза в
+`RECIPE_INGREDIENT_INDEX_INTERVAL` секунд после смены версии. Подбор
+по ингредиентам, как и поиск на SQLite, отдает не больше
+`RECIPE_SEARCH_LIMIT` лучших рецептов; подбор обрезает выдачу уже
+после остальных фильтров.
+"""
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+
+from recipes.models import (CatalogVersion, Ingredient, Recipe,
+                            RecipeIngredient)
+
+INGREDIENT_CATALOG = 'ingredients'
+CATALOG_VERSION_KEY = 'ingredient-catalog-version'
+RECIPES_VERSION_KEY = 'recipe-search-version'
+RECIPE_INGREDIENTS_VERSION_KEY = 'recipe-ingredients-version'
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+PREFIX_FACTOR = 0.5
+
+
+def fold(value):
+    """Приводит строку к виду для сравнения: регистр и ё/е не важны."""
+    return value.strip().lower().replace('ё', 'е')
+
+
+def tokenize(value):
+    """Разбивает текст на слова для поиска."""
+    return re.findall(r'\w+', fold(value))
+
+
+def get_version(key):
+    """Возвращает текущую версию данных индекса, заводя её при отсутствии."""
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_catalog_version():
+    """Возвращает текущую версию каталога ингредиентов из кэша, при
+    промахе - из базы."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = CatalogVersion.objects.get_version(INGREDIENT_CATALOG)
+        cache.set(
+            CATALOG_VERSION_KEY, version,
+            settings.INGREDIENT_CATALOG_VERSION_TIMEOUT
+        )
+    return version
+
+
+def invalidate_ingredient_index():
+    """Увеличивает версию каталога - индексы всех процессов устареют.
+
+    Копия в кэше сбрасывается после фиксации транзакции, иначе процесс
+    мог бы закэшировать новую версию вместе со старыми данными.
+    """
+    CatalogVersion.objects.bump(INGREDIENT_CATALOG)
+    transaction.on_commit(lambda: cache.delete(CATALOG_VERSION_KEY))
+
+
+def invalidate_recipe_index():
+    """Сбрасывает версию обратного индекса рецептов."""
+    cache.delete(RECIPES_VERSION_KEY)
+
+
+def invalidate_recipe_ingredient_index():
+    """Сбрасывает версию индекса состава рецептов."""
+    cache.delete(RECIPE_INGREDIENTS_VERSION_KEY)
+
+
+class IngredientIndex:
+    """Префиксный индекс по названиям ингредиентов.
+
+    Перед чтением вызывается `refresh()` - один раз на запрос.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.keys = []
+        self.items = []
+        self.by_id = {}
+        self.lock = threading.Lock()
+
+    def build(self, version):
+        rows = sorted(
+            (fold(name), name, pk, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in rows
+        ]
+        self.keys = [key for key, *_ in rows]
+        self.items = items
+        self.by_id = {item['id']: item for item in items}
+        self.version = version
+
+    def refresh(self, version=None):
+        """Перестраивает индекс, если версия каталога изменилась."""
+        if version is None:
+            version = get_catalog_version()
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.build(version)
+
+    def all(self):
+        return self.items
+
+    def get(self, pk):
+        return self.by_id.get(pk)
+
+    def search(self, query, limit=None):
+        """Ингредиенты, начинающиеся с `query`, затем содержащие `query`."""
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        query = fold(query)
+        keys = self.keys
+        start = position = bisect_left(keys, query)
+        while (
+            position < len(keys)
+            and position - start < limit
+            and keys[position].startswith(query)
+        ):
+            position += 1
+        result = self.items[start:position]
+        if len(result) < limit:
+            matches = []
+            for index, key in enumerate(keys):
+                found = key.find(query)
+                if found > 0:
+                    matches.append((found, index))
+            matches.sort()
+            result += [
+                self.items[index]
+                for _, index in matches[:limit - len(result)]
+            ]
+        return result
+
+
+class RecipeSearchIndex:
+    """Обратный индекс по названиям и текстам рецептов для SQLite."""
+
+    def __init__(self):
+        self.version = None
+        self.tokens = []
+        self.postings = {}
+        self.lock = threading.Lock()
+
+    def build(self, version):
+        postings = defaultdict(lambda: defaultdict(float))
+        for pk, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ):
+            for token in tokenize(name):
+                postings[token][pk] += NAME_WEIGHT
+            for token in tokenize(text):
+                postings[token][pk] += TEXT_WEIGHT
+        self.postings = {token: dict(ids) for token, ids in postings.items()}
+        self.tokens = sorted(self.postings)
+        self.version = version
+
+    def refresh(self):
+        version = get_version(RECIPES_VERSION_KEY)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.build(version)
+
+    def match(self, term):
+        """Веса рецептов со словами, начинающимися с `term`."""
+        scores = defaultdict(float)
+        position = bisect_left(self.tokens, term)
+        while (
+            position < len(self.tokens)
+            and self.tokens[position].startswith(term)
+        ):
+            token = self.tokens[position]
+            factor = 1.0 if token == term else PREFIX_FACTOR
+            for pk, weight in self.postings[token].items():
+                scores[pk] += weight * factor
+            position += 1
+        return scores
+
+    def search(self, query, limit=None):
+        """Возвращает {id: релевантность} рецептов со всеми словами
+        запроса."""
+        self.refresh()
+        if limit is None:
+            limit = settings.RECIPE_SEARCH_LIMIT
+        result = None
+        for term in tokenize(query):
+            scores = self.match(term)
+            if result is None:
+                result = scores
+            else:
+                result = {
+                    pk: score + scores[pk]
+                    for pk, score in result.items() if pk in scores
+                }
+            if not result:
+                return {}
+        if not result:
+            return {}
+        return dict(
+            sorted(result.items(), key=lambda item: -item[1])[:limit]
+        )
+
+
+RecipeIngredientSnapshot = namedtuple(
+    'RecipeIngredientSnapshot',
+    ('version', 'built_at', 'ids', 'sizes', 'postings', 'by_size')
+)
+
+
+class RecipeIngredientIndex:
+    """Индекс состава рецептов для подбора по ингредиентам.
+
+    Рецепты пронумерованы подряд, списки рецептов по ингредиентам
+    хранятся в `array` - по 4 байта на строку состава, поэтому сотни
+    тысяч рецептов занимают десятки мегабайт. Пересечения и подсчет
+    совпадений выполняются встроенными `set` и `Counter`.
+
+    Индекс строится целиком в локальных переменных и публикуется одной
+    заменой `snapshot`, а `match()` читает снимок один раз - запрос,
+    пришедший во время перестройки, видит старый или новый индекс,
+    но не их смесь.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.lock = threading.Lock()
+
+    def build(self, version):
+        ids = array('q', Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True
+        ))
+        positions = {pk: position for position, pk in enumerate(ids)}
+        sizes = array('H', bytes(2 * len(ids)))
+        postings = defaultdict(lambda: array('I'))
+        for recipe_id, ingredient_id in RecipeIngredient.objects.order_by(
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            position = positions.get(recipe_id)
+            if position is not None:
+                postings[ingredient_id].append(position)
+                sizes[position] += 1
+        by_size = defaultdict(lambda: array('I'))
+        for position, size in enumerate(sizes):
+            by_size[size].append(position)
+        self.snapshot = RecipeIngredientSnapshot(
+            version, time.monotonic(), ids, sizes, dict(postings),
+            dict(by_size)
+        )
+
+    def refresh(self):
+        """Возвращает актуальный снимок индекса."""
+        version = get_version(RECIPE_INGREDIENTS_VERSION_KEY)
+        snapshot = self.snapshot
+        if snapshot is None or version != snapshot.version and (
+            time.monotonic() - snapshot.built_at
+            >= settings.RECIPE_INGREDIENT_INDEX_INTERVAL
+        ):
+            with self.lock:
+                snapshot = self.snapshot
+                if snapshot is None or version != snapshot.version:
+                    self.build(version)
+                    snapshot = self.snapshot
+        return snapshot
+
+    def match(self, required=(), excluded=(), pantry=(), max_missing=None,
+              limit=None):
+        """Возвращает {id: доля имеющихся ингредиентов} лучших рецептов.
+
+        В рецепте должны быть все `required` и не должно быть ни одного
+        из `excluded`. Имеющимися считаются `pantry` и `required`;
+        при заданном `max_missing` недостающих не больше него.
+        С `limit` возвращается не больше стольких рецептов с наибольшей
+        долей, без него - все подходящие.
+        """
+        snapshot = self.refresh()
+        postings, sizes, empty = snapshot.postings, snapshot.sizes, ()
+        counts = Counter()
+        for pk in set(pantry) | set(required):
+            counts.update(postings.get(pk, empty))
+        if required:
+            lists = sorted(
+                (postings.get(pk, empty) for pk in set(required)), key=len
+            )
+            candidates = set(lists[0])
+            for positions in lists[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(positions)
+        else:
+            candidates = set(counts)
+            if max_missing:
+                for size, positions in snapshot.by_size.items():
+                    if 0 < size <= max_missing:
+                        candidates.update(positions)
+        for pk in set(excluded):
+            if not candidates:
+                break
+            candidates.difference_update(postings.get(pk, empty))
+        if max_missing is not None:
+            candidates = [
+                position for position in candidates
+                if sizes[position] - counts[position] <= max_missing
+            ]
+        best = (
+            (counts[position] / sizes[position], position)
+            for position in candidates
+        )
+        if limit is not None:
+            best = heapq.nlargest(limit, best)
+        ids = snapshot.ids
+        return {ids[position]: coverage for coverage, position in best}
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по запросу и сортирует их по релевантности."""
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=settings.SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        )
+    else:
+        scores = recipe_search_index.search(query)
+        queryset = queryset.filter(pk__in=scores).annotate(rank=Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+            default=Value(0.0),
+            output_field=FloatField()
+        ))
+    return queryset.order_by('-rank', '-pub_date', '-id')
+
+
+def filter_by_ingredients(queryset, required=(), excluded=(), pantry=(),
+                          max_missing=None):
+    """Отбирает рецепты по составу и сортирует их по доле имеющихся
+    ингредиентов.
+
+    Id и доли передаются в базу списком `pk IN` и выражением `CASE`
+    на столько же ветвей, поэтому их не больше `RECIPE_SEARCH_LIMIT`.
+    Если по составу подходит больше рецептов, из базы читаются id
+    рецептов, прошедших остальные фильтры `queryset`, и обрезаются уже
+    они - другие фильтры не теряют подходящие рецепты из-за чужих.
+    """
+    coverage = recipe_ingredient_index.match(
+        required, excluded, pantry, max_missing
+    )
+    limit = settings.RECIPE_SEARCH_LIMIT
+    if len(coverage) > limit:
+        coverage = dict(heapq.nlargest(
+            limit,
+            (
+                (pk, coverage[pk])
+                for pk in queryset.order_by().values_list(
+                    'pk', flat=True
+                ).iterator()
+                if pk in coverage
+            ),
+            key=lambda item: (item[1], item[0])
+        ))
+    queryset = queryset.filter(pk__in=coverage).annotate(coverage=Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in coverage.items()],
+        default=Value(0.0),
+        output_field=FloatField()
+    ))
+    return queryset.order_by('-coverage', '-pub_date', '-id')
+
+
+ingredient_index = IngredientIndex()
+recipe_search_index = RecipeSearchIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
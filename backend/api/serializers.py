@@ -1,16 +1,29 @@
 import webcolors
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from drf_extra_fields.fields import Base64ImageField
 
+from recipes.images import FORMATS, get_renditions
 from recipes.models import (Ingredient, IsFavoriteRecipe, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, delete_returning)
+from recipes.storage import image_storage
 from users.models import Follow
+from .cache import invalidate_recipes
+from .search import invalidate_recipe_ingredient_index
+from .subscriptions import get_subscription_resolver
 
 User = get_user_model()
 
+MAX_BATCH_SIZE = 100
+
 
 class CustomUserSerializer(UserSerializer):
     """Возвращает объекты модели User."""
@@ -28,10 +41,9 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return obj.following.filter(user=user).exists()
-        return False
+        return get_subscription_resolver(
+            self.context.get('request')
+        ).is_subscribed(obj.pk)
 
 
 class NameColor2Hex(serializers.Field):
@@ -87,6 +99,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     author = CustomUserSerializer()
     image = Base64ImageField()
+    images = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -101,28 +114,62 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time'
         )
 
+    def get_images(self, obj):
+        """Ссылки на уменьшенные копии картинки по форматам и ширинам.
+
+        Пока копии не готовы, вместо каждой отдается исходная картинка.
+        """
+        if not obj.image:
+            return None
+        request = self.context.get('request')
+        renditions = get_renditions(obj)
+        images = {}
+        for image_format in FORMATS:
+            images[image_format] = {}
+            for width in settings.RECIPE_IMAGE_WIDTHS:
+                name = renditions.get(image_format, {}).get(str(width))
+                url = image_storage.url(name) if name else obj.image.url
+                images[image_format][str(width)] = (
+                    request.build_absolute_uri(url) if request else url
+                )
+        return images
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if self.context.get('request').user.is_authenticated:
             return obj.is_favorite.filter(user=user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if self.context.get('request').user.is_authenticated:
             return obj.in_shopping_cart.filter(user=user).exists()
         return False
 
 
+class RecipeImageField(Base64ImageField):
+    """Принимает картинку строкой base64 или файлом из multipart-формы."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return serializers.ImageField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
 class RecipeCreateAndUpdateSerializer(serializers.ModelSerializer):
     """Добавляет/обновляет объект модели Recipe."""
 
     ingredients = RecipeIngredientSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -137,31 +184,34 @@ class RecipeCreateAndUpdateSerializer(serializers.ModelSerializer):
 
     def create_ingredients(self, instance, ingredients_data):
         """Добавление ингредиентов к рецепту."""
-        data = []
-        for ingredient in ingredients_data:
-            ingredient_data = ingredient['ingredient']
-            current_ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_data['id']
-            )
-            RecIng = RecipeIngredient(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=instance,
-                ingredient=current_ingredient,
+                ingredient_id=ingredient['ingredient']['id'],
                 amount=ingredient['amount']
             )
-            data.append(RecIng)
-        RecipeIngredient.objects.bulk_create(data)
+            for ingredient in ingredients_data
+        )
+        invalidate_recipes([instance.pk])
+        invalidate_recipe_ingredient_index()
 
-    def validate(self, attrs):
-        data = []
-        for ingredients in attrs.get('ingredients'):
-            if ingredients['ingredient']['id'] in data:
-                raise serializers.ValidationError(
-                    'Ингредиент уже добавлен в рецепт'
+    def validate_ingredients(self, value):
+        """Проверяет ингредиенты одним запросом к базе."""
+        ids = [ingredient['ingredient']['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиент уже добавлен в рецепт'
+            )
+        unknown = set(ids) - set(Ingredient.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        if unknown:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}'.format(
+                    ', '.join(str(pk) for pk in sorted(unknown))
                 )
-            else:
-                data.append(ingredients['ingredient']['id'])
-        return super().validate(attrs)
+            )
+        return value
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
@@ -172,103 +222,194 @@ class RecipeCreateAndUpdateSerializer(serializers.ModelSerializer):
         self.create_ingredients(instance, ingredients_data)
         return instance
 
+    def update_ingredients(self, instance, ingredients_data):
+        """Приводит ингредиенты рецепта к переданным, изменяя только
+        отличающиеся строки."""
+        current = {
+            item.ingredient_id: item
+            for item in instance.recipeingredient_set.all()
+        }
+        old = {pk: item.amount for pk, item in current.items()}
+        requested = {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        removed = current.keys() - requested.keys()
+        added = [
+            RecipeIngredient(
+                recipe=instance, ingredient_id=pk, amount=amount
+            )
+            for pk, amount in requested.items() if pk not in current
+        ]
+        changed = []
+        for pk, amount in requested.items():
+            if pk in current and current[pk].amount != amount:
+                current[pk].amount = amount
+                changed.append(current[pk])
+        if not (removed or added or changed):
+            return
+        # Массовые операции без сигналов: updated_at уже обновлен
+        # сохранением рецепта в update(), кэш сбрасывается ниже.
+        if removed:
+            delete_returning(
+                RecipeIngredient, 'id', recipe=instance.pk, ingredient=removed
+            )
+        RecipeIngredient.objects.bulk_create(added)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        invalidate_recipes([instance.pk])
+        invalidate_recipe_ingredient_index()
+        ShoppingListItem.objects.change_recipe_ingredients(
+            instance.pk, old, requested
+        )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
         instance = super().update(instance, validated_data)
-        instance.ingredients.clear()
-        instance.tags.clear()
-        instance.tags.set(tags)
-        self.create_ingredients(instance, ingredients_data)
-        instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients_data is not None:
+            self.update_ingredients(instance, ingredients_data)
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.for_user(request.user).get(pk=instance.pk)
         return RecipeSerializer(
-            instance, context={'request': self.context.get('request')}
+            instance, context={'request': request}
         ).data
 
 
-class IsFavoriteSerializer(serializers.ModelSerializer):
-    """Создает связь рецепт-избранное."""
+class UserRecipeSerializer(serializers.ModelSerializer):
+    """Создает/удаляет связь рецепта с текущим пользователем.
+
+    Добавление - одна вставка, удаление - один DELETE; повторное действие
+    определяется по конфликту вставки или числу удаленных строк.
+    """
+
+    link_model = None
+    exists_message = None
+    missing_message = None
 
     class Meta:
         model = Recipe
         fields = ['id', 'name', 'image', 'cooking_time']
         read_only_fields = ['id', 'name', 'image', 'cooking_time']
 
-    def create(self, validated_data):
-        recipe_id = self.context.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        IsFavoriteRecipe.objects.create(
-            user=self.context.get('request').user,
-            recipe=recipe
-        )
-        return recipe
+    def create_link(self):
+        user = self.context.get('request').user
+        if not self.link_model.objects.add_recipe(user, self.instance.pk):
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.exists_message]}
+            )
 
-    def validate(self, attrs):
-        request = self.context.get('request')
-        user = request.user
-        recipe_id = self.context.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        if request.method == 'POST':
-            if IsFavoriteRecipe.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise serializers.ValidationError(
-                    'Вы уже добавили рецепт в избранное'
-                )
-        else:
-            if not IsFavoriteRecipe.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Вы не добавляли этот рецепт в избранное'},
-                )
-        return super().validate(attrs)
+    @classmethod
+    def delete_link(cls, user, recipe_id):
+        if not cls.link_model.objects.remove_recipe(user, recipe_id):
+            get_object_or_404(Recipe, id=recipe_id)
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [cls.missing_message]}
+            )
+
+
+class IsFavoriteSerializer(UserRecipeSerializer):
+    """Создает связь рецепт-избранное."""
 
+    link_model = IsFavoriteRecipe
+    exists_message = 'Вы уже добавили рецепт в избранное'
+    missing_message = 'Вы не добавляли этот рецепт в избранное'
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+
+class ShoppingCartSerializer(UserRecipeSerializer):
     """Создает связь рецепт-список покупок."""
 
-    class Meta:
-        model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
-        read_only_fields = ['id', 'name', 'image', 'cooking_time']
+    link_model = ShoppingCart
+    exists_message = 'Вы уже добавили рецепт в список покупок'
+    missing_message = 'Вы не добавляли этот рецепт в список покупок'
 
-    def create(self, validated_data):
-        recipe_id = self.context.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        ShoppingCart.objects.create(
-            user=self.context.get('request').user,
-            recipe=recipe
-        )
-        return recipe
+
+class UserRecipeBatchSerializer(serializers.Serializer):
+    """Пакетно создает или удаляет связи рецептов с пользователем.
+
+    Все id проверяются одним запросом, который заодно показывает, какие
+    рецепты уже связаны с пользователем. Возвращает статус для каждого id.
+    """
+
+    link_model = None
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
 
     def validate(self, attrs):
+        user = self.context.get('request').user
+        attrs['present'] = dict(Recipe.objects.filter(
+            id__in=attrs['ids']
+        ).annotate(present=Exists(self.link_model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))).values_list('id', 'present'))
+        return attrs
+
+    def create(self, validated_data):
         request = self.context.get('request')
-        user = request.user
-        recipe_id = self.context.get('recipe_id')
-        recipe = get_object_or_404(Recipe, id=recipe_id)
+        present = validated_data['present']
         if request.method == 'POST':
-            if ShoppingCart.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise serializers.ValidationError(
-                    'Вы уже добавили рецепт в список покупок'
-                )
+            changed = self.link_model.objects.add_recipes(request.user, [
+                pk for pk, exists in present.items() if not exists
+            ])
+            statuses = ('added', 'already_added')
         else:
-            if not ShoppingCart.objects.filter(
-                user=user,
-                recipe=recipe
-            ).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Вы не добавляли этот рецепт в список покупок'},
+            changed = self.link_model.objects.remove_recipes(request.user, [
+                pk for pk, exists in present.items() if exists
+            ])
+            statuses = ('removed', 'not_added')
+        changed = set(changed)
+        return [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in present
+                    else statuses[0] if pk in changed
+                    else statuses[1]
                 )
-        return super().validate(attrs)
+            }
+            for pk in validated_data['ids']
+        ]
+
+    def to_representation(self, instance):
+        return {'results': instance}
+
+
+class IsFavoriteBatchSerializer(UserRecipeBatchSerializer):
+    """Пакетно добавляет/удаляет рецепты в избранном."""
+
+    link_model = IsFavoriteRecipe
+
+
+class ShoppingCartBatchSerializer(UserRecipeBatchSerializer):
+    """Пакетно добавляет/удаляет рецепты в корзине."""
+
+    link_model = ShoppingCart
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Возвращает сводный список покупок пользователя."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -313,15 +454,20 @@ class GetSubscriptionsSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj)
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'recipe_previews'):
+            recipes = obj.recipe_previews
+        else:
+            request = self.context.get('request')
+            limit = request.query_params.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj)
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipeForSubscribe(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from .cache import invalidate_recipes
+from .conditional import invalidate_tags
+from .search import (invalidate_ingredient_index, invalidate_recipe_index,
+                     invalidate_recipe_ingredient_index)
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+    invalidate_recipe_index()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+    invalidate_recipe_ingredient_index()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_recipes(sender.objects.filter(
+            **{instance._meta.model_name: instance}
+        ).values_list('recipe_id', flat=True))
+    elif action.startswith('post_') and pk_set:
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    invalidate_recipes(recipe_ids)
+    Recipe.objects.filter(pk__in=recipe_ids).touch()
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_tags()
+    recipe_ids = list(instance.recipe_set.values_list('pk', flat=True))
+    invalidate_recipes(recipe_ids)
+    Recipe.objects.filter(pk__in=recipe_ids).touch()
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    invalidate_tags()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    invalidate_ingredient_index()
+    recipe_ids = list(
+        instance.recipeingredient_set.values_list('recipe_id', flat=True)
+    )
+    invalidate_recipes(recipe_ids)
+    Recipe.objects.filter(pk__in=recipe_ids).touch()
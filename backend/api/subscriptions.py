@@ -0,0 +1,71 @@
+"""Признак `is_subscribed` для всех сериализаторов одного запроса.
+
+Id авторов, на которых подписан пользователь, загружаются одним запросом
+при первом обращении и хранятся в объекте запроса. Счётчики `queries` и
+`lookups` показывают, сколько запросов к базе понадобилось на все ответы.
+"""
+import logging
+
+from django.conf import settings
+
+from users.models import Follow
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionResolver:
+    """Отвечает, подписан ли пользователь запроса на автора."""
+
+    def __init__(self, user):
+        self.user = user
+        self.followed_ids = None
+        self.queries = 0
+        self.lookups = 0
+
+    def load(self):
+        self.followed_ids = frozenset(Follow.objects.filter(
+            user=self.user
+        ).values_list('following_id', flat=True))
+        self.queries += 1
+
+    def is_subscribed(self, author_id):
+        if not self.user.is_authenticated:
+            return False
+        if self.followed_ids is None:
+            self.load()
+        self.lookups += 1
+        return author_id in self.followed_ids
+
+
+def get_subscription_resolver(request):
+    """Возвращает резолвер подписок, общий для всего запроса."""
+    request = getattr(request, '_request', request)
+    resolver = getattr(request, 'subscription_resolver', None)
+    if resolver is None:
+        resolver = request.subscription_resolver = SubscriptionResolver(
+            request.user
+        )
+    return resolver
+
+
+class SubscriptionResolverMiddleware:
+    """Журналирует работу резолвера подписок, а в режиме DEBUG добавляет
+    заголовок `X-Subscription-Queries` с числом запросов и проверок."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        resolver = getattr(request, 'subscription_resolver', None)
+        if resolver is not None:
+            logger.debug(
+                '%s %s: is_subscribed - %d запрос(ов) на %d проверок',
+                request.method, request.path,
+                resolver.queries, resolver.lookups
+            )
+            if settings.DEBUG:
+                response['X-Subscription-Queries'] = (
+                    f'queries={resolver.queries}; lookups={resolver.lookups}'
+                )
+        return response
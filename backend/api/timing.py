@@ -0,0 +1,159 @@
+"""Замеры запросов к API.
+
+`RequestTimingMiddleware` считает для каждого запроса число SQL-запросов
+и время в базе (через `connection.execute_wrapper`), время сериализации
+(свойство `data` всех сериализаторов DRF, включая djoser, и участки,
+обернутые в `measure(request, 'serializer')`), время представления
+и общее время. Замеры отдаются заголовком `Server-Timing`,
+а запросы дольше `REQUEST_TIMING_SLOW_MS` или с числом SQL-запросов
+от `REQUEST_TIMING_SLOW_QUERIES` попадают в журнал вместе с самыми
+частыми повторяющимися SQL-запросами - так видны N+1.
+
+При `REQUEST_TIMING = False` middleware исключается из цепочки при
+запуске и не подменяет `BaseSerializer.data`, а `measure()` сводится
+к одной проверке атрибута запроса.
+SQL-запросы, выполненные при отдаче `StreamingHttpResponse`, не
+учитываются: тело ответа читается уже после middleware.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+SERIALIZER = 'serializer'
+
+
+class RequestTimings:
+    """Замеры одного запроса, заодно обертка для `execute_wrapper`."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.sections = defaultdict(float)
+        self.active = set()
+        self.statements = Counter()
+        self.statement_time = defaultdict(float)
+        self.view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            self.statements[sql] += 1
+            self.statement_time[sql] += elapsed
+
+    def repeated(self, limit):
+        """Возвращает до `limit` SQL-запросов, выполненных больше раза."""
+        return [
+            (sql, count, self.statement_time[sql])
+            for sql, count in self.statements.most_common(limit)
+            if count > 1
+        ]
+
+
+def get_timings(request):
+    request = getattr(request, '_request', request)
+    return getattr(request, 'request_timings', None)
+
+
+@contextmanager
+def measure(request, name):
+    """Добавляет время блока к участку `name` замеров запроса.
+
+    Вложенные замеры одного участка не складываются.
+    """
+    timings = get_timings(request)
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.sections[name] += time.perf_counter() - started
+        timings.active.discard(name)
+
+
+def instrument_serializers():
+    """Подменяет `BaseSerializer.data`, чтобы замерять любой сериализатор.
+
+    `Serializer.data` и `ListSerializer.data` обращаются к нему через
+    `super()`, поэтому замер покрывает и списки, и вложенные вызовы.
+    """
+    data = BaseSerializer.data
+    if getattr(data.fget, 'measured', False):
+        return
+
+    def measured_data(self):
+        with measure(self.context.get('request'), SERIALIZER):
+            return data.fget(self)
+    measured_data.measured = True
+    BaseSerializer.data = property(measured_data)
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 1)
+
+
+class RequestTimingMiddleware:
+    """Замеряет запрос и добавляет заголовок `Server-Timing`."""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        instrument_serializers()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.request_timings = RequestTimings()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timings):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        view = (
+            started + total - timings.view_started
+            if timings.view_started is not None else 0.0
+        )
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={milliseconds(timings.db)};'
+            f'desc="{timings.queries} queries"',
+            *(
+                f'{name};dur={milliseconds(value)}'
+                for name, value in timings.sections.items()
+            ),
+            f'view;dur={milliseconds(view)}',
+            f'total;dur={milliseconds(total)}',
+        ])
+        if (
+            total * 1000 >= settings.REQUEST_TIMING_SLOW_MS
+            or timings.queries >= settings.REQUEST_TIMING_SLOW_QUERIES
+        ):
+            self.log(request, response, timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.request_timings.view_started = time.perf_counter()
+
+    def log(self, request, response, timings, total):
+        repeated = timings.repeated(settings.REQUEST_TIMING_TOP_STATEMENTS)
+        logger.warning(
+            '%s %s %s: %.1f мс, %d SQL-запрос(ов) за %.1f мс%s',
+            request.method, request.get_full_path(), response.status_code,
+            total * 1000, timings.queries, timings.db * 1000,
+            ''.join(
+                f'\n  {count} x {milliseconds(elapsed)} мс: {sql}'
+                for sql, count, elapsed in repeated
+            )
+        )
@@ -1,30 +1,43 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from recipes.models import (Ingredient, IsFavoriteRecipe, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import FollowPagination
+from recipes.models import (Ingredient, Recipe, ShoppingListItem, Tag,
+                            TimelineEntry)
+from .cache import get_recipe_cards, get_versions
+from .conditional import (CatalogConditionalMixin, conditional_response,
+                          get_tags_version, make_etag)
+from .filters import RecipeFilter
+from .pagination import FeedPagination, FollowPagination, RecipePagination
+from .parsers import RecipeMultiPartParser
 from .permissions import IsAdmin, IsAuthor, ReadOnly
+from .renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                        ShoppingListTxtRenderer)
+from .search import get_catalog_version, ingredient_index
 from .serializers import (CreateSubscribeSerializer,
                           GetSubscriptionsSerializer, IngredientSerializer,
-                          IsFavoriteSerializer,
+                          IsFavoriteBatchSerializer, IsFavoriteSerializer,
                           RecipeCreateAndUpdateSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          ShoppingCartBatchSerializer, ShoppingCartSerializer,
+                          ShoppingListItemSerializer, TagSerializer)
+from .subscriptions import get_subscription_resolver
 
 User = get_user_model()
 
+SHOPPING_LIST_FILENAME = 'shopping_list'
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogConditionalMixin, viewsets.ReadOnlyModelViewSet):
     """Обрабатывает GET запросы для тэгов."""
 
     queryset = Tag.objects.all()
@@ -32,16 +45,58 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAdmin | ReadOnly]
     pagination_class = None
 
+    def get_catalog_version(self):
+        return get_tags_version()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            request, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            request, partial(super().retrieve, request, *args, **kwargs)
+        )
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Обрабатывает GET запросы для ингредиентов."""
+class IngredientViewSet(CatalogConditionalMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    """Обрабатывает GET запросы для ингредиентов.
+
+    Ответы строятся по индексу `ingredient_index`, версия каталога
+    берется из кэша, так что к базе запросы не идут.
+    """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAdmin | ReadOnly]
     pagination_class = None
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    lookup_value_regex = r'\d+'
+
+    def get_catalog_version(self):
+        """Версия каталога, по которой индекс обновлен для этого запроса."""
+        if not hasattr(self, 'catalog_version'):
+            self.catalog_version = get_catalog_version()
+            ingredient_index.refresh(self.catalog_version)
+        return self.catalog_version
+
+    def list(self, request, *args, **kwargs):
+        self.get_catalog_version()
+        name = request.query_params.get('name')
+        if name:
+            return self.conditional(
+                request, lambda: Response(ingredient_index.search(name))
+            )
+        return self.conditional(
+            request, lambda: Response(ingredient_index.all())
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        self.get_catalog_version()
+        ingredient = ingredient_index.get(int(kwargs[self.lookup_field]))
+        if ingredient is None:
+            raise Http404
+        return self.conditional(request, lambda: Response(ingredient))
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -51,10 +106,89 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     permission_classes = [ReadOnly | IsAdmin | IsAuthor]
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
+    parser_classes = (JSONParser, FormParser, RecipeMultiPartParser)
+    lookup_value_regex = r'\d+'
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.action in ['list', 'retrieve', 'feed', 'similar']:
+            user = self.request.user
+            return Recipe.objects.only(
+                'id', 'author', 'pub_date', 'updated_at'
+            ).with_user_flags(user)
+        return super().get_queryset()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                get_recipe_cards(page, request)
+            )
+        return Response(get_recipe_cards(queryset, request))
+
+    def get_cards(self, recipe_ids):
+        """Возвращает карточки рецептов в порядке `recipe_ids`."""
+        recipes = {
+            recipe.pk: recipe
+            for recipe in self.get_queryset().filter(pk__in=recipe_ids)
+        }
+        return get_recipe_cards(
+            [recipes[pk] for pk in recipe_ids if pk in recipes], self.request
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Возвращает рецепт или 304, если у клиента актуальная версия.
+
+        ETag учитывает признаки, зависящие от пользователя, поэтому
+        Last-Modified отдается только анонимным пользователям.
+        """
+        recipe = self.get_object()
+        parts = [
+            recipe.pk, recipe.updated_at.isoformat(),
+            get_versions([recipe.pk])[recipe.pk]
+        ]
+        last_modified = recipe.updated_at
+        if request.user.is_authenticated:
+            parts += [
+                recipe.is_favorited,
+                recipe.is_in_shopping_cart,
+                get_subscription_resolver(request).is_subscribed(
+                    recipe.author_id
+                ),
+            ]
+            last_modified = None
+        return conditional_response(
+            request,
+            lambda: Response(get_recipe_cards([recipe], request)[0]),
+            make_etag(*parts), last_modified, vary=('Authorization',)
+        )
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Возвращает ленту рецептов авторов, на которых подписан
+        пользователь, от новых к старым."""
+        recipe_ids = self.paginate_queryset(TimelineEntry.objects.all())
+        return self.get_paginated_response(self.get_cards(recipe_ids))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Возвращает рецепты, похожие на данный по ингредиентам."""
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        recipe_ids = list(recipe.similar_recipes.order_by(
+            '-score'
+        ).values_list(
+            'similar_id', flat=True
+        )[:settings.SIMILAR_RECIPES_COUNT])
+        return Response(self.get_cards(recipe_ids))
+
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return RecipeCreateAndUpdateSerializer
@@ -70,60 +204,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_ingredient_sum_in_shopping_cart(self):
         """Возвращает список сумм ингредиентов в корзине."""
-        return RecipeIngredient.objects.filter(
-            recipe__in_shopping_cart__user=self.request.user
+        return ShoppingListItem.objects.filter(
+            user=self.request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
 
     @action(
-        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            ShoppingListTxtRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ]
     )
     def download_shopping_cart(self, request):
-        """Возвращает файл.txt со списком ингредиентов рецептов в корзине."""
-        ingredients_sum = self.get_ingredient_sum_in_shopping_cart()
-        current_ingredient = [(
-            f'{ingredient["ingredient__name"]} '
-            f'{ingredient["amount"]} '
-            f'{ingredient["ingredient__measurement_unit"]}\n'
-        ) for ingredient in ingredients_sum]
-        file = ''.join(current_ingredient)
-        content = (
-            f'Ваш список покупок:\n'
-            f'{file}'
+        """Возвращает файл со списком ингредиентов рецептов в корзине.
+
+        Формат (txt, csv или json) выбирается параметром `format` или
+        заголовком Accept.
+        """
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(
+                self.get_ingredient_sum_in_shopping_cart().iterator()
+            ),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
         )
-        response = HttpResponse(content, content_type='text/plain')
         response['Content-Disposition'] = (
-            'attachment; filename={}'.format('.txt')
+            f'attachment; filename={SHOPPING_LIST_FILENAME}.{renderer.format}'
         )
         return response
 
+    @action(
+        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+    )
+    def shopping_list(self, request):
+        """Возвращает сводный список покупок текущего пользователя."""
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        return Response(ShoppingListItemSerializer(
+            items, many=True, context={'request': request}
+        ).data)
+
     @staticmethod
     def add_to(request, serializer_class, pk):
         """Создает связь рецепта с id=pk с текущим пользователем."""
-        serializer = serializer_class(
-            data=request.data,
-            context={'request': request, 'recipe_id': pk}
+        recipe = get_object_or_404(
+            Recipe.objects.only(*serializer_class.Meta.fields), id=pk
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer = serializer_class(recipe, context={'request': request})
+        serializer.create_link()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def delete_to(request, serializer_class, model, pk):
+    def delete_to(request, serializer_class, pk):
         """Удаляет связь рецепта с id=pk с текущим пользователем."""
-        user = request.user
+        serializer_class.delete_link(request.user, pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def batch(request, serializer_class):
+        """Пакетно создает/удаляет связи рецептов из `ids` с пользователем."""
         serializer = serializer_class(
-            data=request.data,
-            context={'request': request, 'recipe_id': pk}
+            data=request.data, context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.filter(
-            user=user,
-            recipe=recipe
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         detail=True, methods=['post'], permission_classes=[IsAuthenticated]
@@ -137,9 +288,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
         """Обрабатывает запросы на удаление рецепта из избранного."""
-        return self.delete_to(
-            request, IsFavoriteSerializer, IsFavoriteRecipe, pk
-        )
+        return self.delete_to(request, IsFavoriteSerializer, pk)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        """Пакетно добавляет/удаляет рецепты в избранном."""
+        return self.batch(request, IsFavoriteBatchSerializer)
 
     @action(
         detail=True, methods=['post'], permission_classes=[IsAuthenticated]
@@ -153,9 +312,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
         """Обрабатывает запросы на удаление рецепта из корзины."""
-        return self.delete_to(
-            request, ShoppingCartSerializer, ShoppingCart, pk
-        )
+        return self.delete_to(request, ShoppingCartSerializer, pk)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/batch'
+    )
+    def shopping_cart_batch(self, request):
+        """Пакетно добавляет/удаляет рецепты в корзине."""
+        return self.batch(request, ShoppingCartBatchSerializer)
 
 
 class FollowListView(generics.ListAPIView):
@@ -168,7 +335,21 @@ class FollowListView(generics.ListAPIView):
     def get_queryset(self):
         return User.objects.filter(
             following__user=self.request.user
+        ).with_recipes_count().order_by('username')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(
+            self.get_queryset()
+        ))
+        limit = request.query_params.get('recipes_limit')
+        recipes = Recipe.objects.latest_by_author(
+            [author.pk for author in page],
+            int(limit) if limit and limit.isdigit() else None
         )
+        for author in page:
+            author.recipe_previews = recipes[author.pk]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class FollowView(APIView):
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.subscriptions.SubscriptionResolverMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -88,6 +90,83 @@ else:
         }
     }
 
+# Карточки рецептов и версии индексов должны видеть все процессы: сервер
+# и команды manage.py. В docker compose для этого поднимается memcached
+# (CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache,
+# CACHE_LOCATION=memcached:11211). LocMemCache по умолчанию годится только
+# для разработки в одном процессе: сбросы из других процессов, в том числе
+# из команд manage.py, до сервера не доходят.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    # На рецепт приходится два ключа: версия и карточка.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 50000)),
+    }
+
+RECIPE_CARD_CACHE_TIMEOUT = int(os.getenv('RECIPE_CARD_CACHE_TIMEOUT', 3600))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Копия версии каталога ингредиентов живет в кэше столько секунд;
+# с общим кэшем изменения видны сразу, с LocMemCache - не позже.
+INGREDIENT_CATALOG_VERSION_TIMEOUT = int(
+    os.getenv('INGREDIENT_CATALOG_VERSION_TIMEOUT', 60)
+)
+
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'russian')
+
+# Поиск рецептов на SQLite и подбор по ингредиентам отдают не больше
+# стольких лучших рецептов: они передаются в базу списком id и CASE
+# на столько же ветвей, дальше выдача обрезается (подбор по ингредиентам
+# обрезает уже отфильтрованные по остальным параметрам рецепты).
+RECIPE_SEARCH_LIMIT = int(os.getenv('RECIPE_SEARCH_LIMIT', 1000))
+
+# Индекс состава рецептов перестраивается после изменений не чаще,
+# чем раз в указанное число секунд.
+RECIPE_INGREDIENT_INDEX_INTERVAL = int(
+    os.getenv('RECIPE_INGREDIENT_INDEX_INTERVAL', 30)
+)
+
+# Рецепты авторов с большим числом подписчиков не раскладываются по лентам
+# при публикации, а подмешиваются в ленту при чтении.
+FEED_PUSH_MAX_FOLLOWERS = int(os.getenv('FEED_PUSH_MAX_FOLLOWERS', 10000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 200))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+# Замеры запросов к API: заголовок Server-Timing и журнал медленных запросов.
+REQUEST_TIMING = os.getenv('REQUEST_TIMING', 'False').lower() == 'true'
+
+REQUEST_TIMING_SLOW_MS = int(os.getenv('REQUEST_TIMING_SLOW_MS', 500))
+
+REQUEST_TIMING_SLOW_QUERIES = int(
+    os.getenv('REQUEST_TIMING_SLOW_QUERIES', 50)
+)
+
+REQUEST_TIMING_TOP_STATEMENTS = int(
+    os.getenv('REQUEST_TIMING_TOP_STATEMENTS', 5)
+)
+
+RECIPE_IMAGE_WIDTHS = (200, 400, 800)
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', 80))
+
+# 0 - обрабатывать картинки сразу после сохранения, без пула процессов.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
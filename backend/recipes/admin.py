@@ -1,6 +1,10 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Ingredient, IsFavoriteRecipe, Recipe, RecipeIngredient, Tag
+from .models import (Ingredient, IsFavoriteRecipe, Recipe, RecipeIngredient,
+                     ShoppingListItem, Tag)
 
 
 class IngredientInline(admin.StackedInline):
@@ -37,9 +41,11 @@ class RecipeAdmin(admin.ModelAdmin):
     def ingredients_list(self, row):
         return ','.join([x.name for x in row.ingredients.all()])
 
-    @admin.display(description='Добавлений в избранное')
+    @admin.display(
+        description='Добавлений в избранное', ordering='favorites_count'
+    )
     def count__is_favorited(self, obj):
-        return obj.is_favorite.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -62,3 +68,17 @@ class IsFavoriteRecipeAdmin(admin.ModelAdmin):
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient')
     list_filter = ('recipe__name',)
+
+    def delete_queryset(self, request, queryset):
+        """Удаляет строки состава, вычитая их из списков покупок."""
+        removed = defaultdict(dict)
+        for recipe_id, ingredient_id, amount in queryset.values_list(
+            'recipe_id', 'ingredient_id', 'amount'
+        ):
+            removed[recipe_id][ingredient_id] = amount
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            for recipe_id, amounts in removed.items():
+                ShoppingListItem.objects.change_recipe_ingredients(
+                    recipe_id, amounts, {}
+                )
@@ -0,0 +1,125 @@
+"""Фоновая обработка картинок рецептов.
+
+После сохранения рецепта с новой картинкой она уходит в пул процессов,
+где Pillow строит уменьшенные копии в WebP и JPEG для ширин из
+`RECIPE_IMAGE_WIDTHS` без метаданных исходного файла. Пути к копиям
+записываются в `Recipe.image_renditions`:
+
+    {'source': 'recipes/images/ab/ab12...ef.jpg',
+     'webp': {'200': 'recipes/renditions/cd/cd34...01.webp', ...},
+     'jpeg': {'200': 'recipes/renditions/9f/9f56...23.jpg', ...}}
+
+Копии лежат в том же хранилище с адресацией по содержимому, что
+и исходные картинки, поэтому одинаковые копии не дублируются.
+
+Процессы пула работают только с байтами (`recipes.rendering` не
+импортирует Django), чтение и запись файлов через хранилище и обновление
+базы выполняет отдельный поток. Процессы пула запускаются через spawn:
+fork из потока работающего сервера копирует чужие блокировки.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Recipe
+from .rendering import FORMATS, render
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_PATH = 'recipes/renditions'
+
+_process_pool = None
+_dispatcher = None
+
+
+def get_renditions(recipe):
+    """Возвращает пути копий картинки рецепта, если они готовы."""
+    renditions = recipe.image_renditions or {}
+    if not recipe.image or renditions.get('source') != recipe.image.name:
+        return {}
+    return renditions
+
+
+def store_renditions(recipe_id, source, rendered):
+    """Сохраняет копии в хранилище и записывает их пути в рецепт."""
+    from api.cache import invalidate_recipes
+
+    renditions = {'source': source}
+    for (key, width), data in rendered.items():
+        name = image_storage.save(
+            f'{RENDITIONS_PATH}/{width}.{FORMATS[key][1]}',
+            ContentFile(data)
+        )
+        renditions.setdefault(key, {})[str(width)] = name
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_renditions=renditions, updated_at=timezone.now()
+    )
+    if updated:
+        invalidate_recipes([recipe_id])
+    return renditions
+
+
+def process(recipe_id, source, pool=None):
+    """Строит и сохраняет копии картинки `source` рецепта."""
+    with image_storage.open(source) as file:
+        data = file.read()
+    args = (data, settings.RECIPE_IMAGE_WIDTHS, settings.RECIPE_IMAGE_QUALITY)
+    if pool is None:
+        rendered = render(*args)
+    else:
+        rendered = pool.submit(render, *args).result()
+    return store_renditions(recipe_id, source, rendered)
+
+
+def create_process_pool(workers):
+    """Пул процессов для `render()`, запускаемых через spawn."""
+    return ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = create_process_pool(settings.RECIPE_IMAGE_WORKERS)
+    return _process_pool
+
+
+def _process_in_background(recipe_id, source):
+    global _process_pool
+    try:
+        try:
+            process(recipe_id, source, _get_process_pool())
+        except BrokenProcessPool:
+            # Пул с упавшим процессом не восстанавливается: заводим
+            # новый и повторяем один раз.
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+            process(recipe_id, source, _get_process_pool())
+    except Exception:
+        logger.exception(
+            'Failed to process image %s of recipe %s', source, recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def enqueue(recipe):
+    """Ставит картинку рецепта в очередь после фиксации транзакции."""
+    global _dispatcher
+    recipe_id, source = recipe.pk, recipe.image.name
+    if not settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: process(recipe_id, source))
+        return
+    if _dispatcher is None:
+        _dispatcher = ThreadPoolExecutor(1, 'recipe-images')
+    transaction.on_commit(
+        lambda: _dispatcher.submit(_process_in_background, recipe_id, source)
+    )
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import CHUNK_SIZE, METRICS, build, refresh
+
+
+class Command(BaseCommand):
+    help = 'Compute similar recipes from shared ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', choices=METRICS, default='jaccard')
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_COUNT
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--changed', action='store_true',
+            help='Only refresh recipes changed since the last run'
+        )
+
+    def handle(self, *args, **options):
+        processed = written = 0
+
+        def progress(recipes, pairs):
+            nonlocal processed, written
+            processed += recipes
+            written += pairs
+            self.stdout.write(f'Processed {processed}: {written} pairs')
+
+        run = refresh if options['changed'] else build
+        run(
+            options['top_k'], options['metric'], options['chunk_size'],
+            progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'OK: processed {processed}, {written} pairs'
+        ))
@@ -0,0 +1,62 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import RENDITIONS_PATH
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+IMAGES_PATH = Recipe._meta.get_field('image').upload_to
+
+
+def walk(path):
+    directories, files = image_storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(posixpath.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = 'Remove recipe image files that no recipe refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report orphaned files without removing them'
+        )
+        parser.add_argument(
+            '--grace', type=int, default=60,
+            help='Keep files younger than this many minutes'
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for image, renditions in Recipe.objects.exclude(
+            image=''
+        ).values_list('image', 'image_renditions').iterator():
+            referenced.add(image)
+            for key, names in (renditions or {}).items():
+                if key != 'source':
+                    referenced.update(names.values())
+
+        threshold = timezone.now() - timedelta(minutes=options['grace'])
+        removed = freed = 0
+        for path in (IMAGES_PATH, RENDITIONS_PATH):
+            if not image_storage.exists(path):
+                continue
+            for name in walk(path):
+                if name in referenced or (
+                    image_storage.get_modified_time(name) > threshold
+                ):
+                    continue
+                removed += 1
+                freed += image_storage.size(name)
+                if not options['dry_run']:
+                    image_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Dry run" if options["dry_run"] else "OK"}: '
+            f'removed {removed} files, {freed} bytes'
+        ))
@@ -1,19 +1,211 @@
 import csv
+import io
+import json
+import sys
+from collections import defaultdict
+from itertools import chain, islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient
+from api.cache import invalidate_recipes
+from api.search import invalidate_ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+DEFAULT_PATH = 'data/ingredients.csv'
+BATCH_SIZE = 5000
+FORMATS = ('csv', 'json')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Читает JSON-массив или JSON Lines с полями name и
+    measurement_unit."""
+    first = file.read(1)
+    while first.isspace():
+        first = file.read(1)
+    if first == '[':
+        items = json.loads(first + file.read())
+    else:
+        items = (
+            json.loads(line)
+            for line in chain([first + file.readline()], file)
+            if line.strip()
+        )
+    for item in items:
+        yield item['name'], item['measurement_unit']
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class Command(BaseCommand):
     help = 'Load data ingredients'
 
-    def handle(self, *args, **options):
-        with open('data/ingredients.csv', encoding='utf8') as file:
-            reader = csv.reader(file)
-            for name, measurement_unit in reader:
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='CSV or JSON file, "-" to read from stdin'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Input format, by default taken from the file extension'
+        )
+        parser.add_argument(
+            '--sync', action='store_true',
+            help=(
+                'Update the measurement unit of ingredients whose name '
+                'has a single unit in the catalog'
+            )
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report changes without writing them'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk_create even on PostgreSQL'
+        )
+
+    def open(self, path):
+        if path == '-':
+            return sys.stdin
+        try:
+            return open(path, encoding='utf8')
+        except OSError as error:
+            raise CommandError(error)
+
+    def get_format(self, path, file_format):
+        if file_format:
+            return file_format
+        if path.endswith('.json') or path.endswith('.jsonl'):
+            return 'json'
+        return 'csv'
+
+    def insert(self, rows, use_copy):
+        """Вставляет новые ингредиенты через COPY или bulk_create."""
+        if use_copy:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'COPY {Ingredient._meta.db_table} '
+                    f'(name, measurement_unit) FROM STDIN WITH (FORMAT csv)',
+                    buffer
                 )
-        print('OK')
+        else:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in rows
+            )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = read_json if self.get_format(
+            path, options['format']
+        ) == 'json' else read_csv
+        sync = options['sync']
+        dry_run = options['dry_run']
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+
+        # (название, единица) -> id, у созданных в этом запуске - None.
+        existing = {}
+        # Название -> id строк каталога, единицы которых можно обновить.
+        by_name = defaultdict(list)
+        for pk, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ):
+            existing[name, unit] = pk
+            by_name[name].append(pk)
+
+        created = processed = 0
+        changed_ids = set()
+        # Строки каталога, уже сопоставленные со строкой файла.
+        matched = set()
+        ambiguous = set()
+        file = self.open(path)
+        try:
+            with transaction.atomic():
+                for chunk in chunks(reader(file), options['batch_size']):
+                    new_rows = []
+                    changed = {}
+                    for name, unit in chunk:
+                        name, unit = name.strip(), unit.strip()
+                        if (name, unit) in existing:
+                            matched.add(existing[name, unit])
+                            continue
+                        pks = by_name.get(name, ())
+                        if not sync or not pks or all(
+                            pk in matched for pk in pks
+                        ):
+                            # Новое название или еще одна единица
+                            # названия, уже встреченного в файле.
+                            existing[name, unit] = None
+                            new_rows.append((name, unit))
+                        elif len(pks) == 1:
+                            pk = pks[0]
+                            existing[name, unit] = pk
+                            matched.add(pk)
+                            changed[pk] = Ingredient(
+                                id=pk, measurement_unit=unit
+                            )
+                        else:
+                            # Несколько единиц одного названия в каталоге:
+                            # какую из них менять, неизвестно.
+                            ambiguous.add(name)
+                    if not dry_run:
+                        self.insert(new_rows, use_copy)
+                        Ingredient.objects.bulk_update(
+                            changed.values(), ['measurement_unit']
+                        )
+                    processed += len(chunk)
+                    created += len(new_rows)
+                    changed_ids.update(changed)
+                    self.stdout.write(
+                        f'Processed {processed}: '
+                        f'created {created}, updated {len(changed_ids)}'
+                    )
+                if not dry_run and (created or changed_ids):
+                    self.invalidate(changed_ids)
+        except (KeyError, IndexError, ValueError) as error:
+            raise CommandError(f'Invalid row after {processed}: {error}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Dry run" if dry_run else "OK"}: processed {processed}, '
+            f'created {created}, updated {len(changed_ids)}'
+        ))
+        if ambiguous:
+            self.stdout.write(self.style.WARNING(
+                'Skipped, several units in the catalog: '
+                + ', '.join(sorted(ambiguous))
+            ))
+
+    def invalidate(self, ingredient_ids):
+        """Обновляет версию каталога и `updated_at` рецептов с измененными
+        ингредиентами - через базу, чтобы это увидел сервер."""
+        invalidate_ingredient_index()
+        recipe_ids = set(RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).values_list('recipe_id', flat=True))
+        Recipe.objects.filter(pk__in=recipe_ids).touch()
+        invalidate_recipes(recipe_ids)
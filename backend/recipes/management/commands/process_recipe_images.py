@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import create_process_pool, get_renditions, process
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Build missing resized copies of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild copies even if they are up to date'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).only('id', 'image', 'image_renditions')
+        processed = 0
+        with create_process_pool(settings.RECIPE_IMAGE_WORKERS or 1) as pool:
+            for recipe in recipes.iterator():
+                if options['all'] or not get_renditions(recipe):
+                    process(recipe.pk, recipe.image.name, pool)
+                    processed += 1
+        self.stdout.write(self.style.SUCCESS(f'OK: {processed}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuild aggregated shopping lists from shopping carts'
+
+    def handle(self, *args, **options):
+        created = ShoppingListItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'OK: {created}'))
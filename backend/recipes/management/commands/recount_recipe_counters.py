@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Recount favorites and shopping cart counters of recipes'
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.recount_counters()
+        self.stdout.write(self.style.SUCCESS(f'OK: {updated}'))
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-18 04:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    def count_subquery(model_name):
+        model = apps.get_model('recipes', model_name)
+        return Coalesce(Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(count=Count('pk')).values('count')
+        ), 0)
+
+    Recipe.objects.update(
+        favorites_count=count_subquery('IsFavoriteRecipe'),
+        in_carts_count=count_subquery('ShoppingCart'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в корзину'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
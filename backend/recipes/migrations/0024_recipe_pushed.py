@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 05:25
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def fill_pushed(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    Recipe.objects.filter(
+        Exists(TimelineEntry.objects.filter(recipe=OuterRef('pk')))
+    ).update(pushed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='pushed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Разослан в ленты подписчиков'),
+        ),
+        migrations.RunPython(fill_pushed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(pushed=False), fields=['author', '-pub_date', '-id'], name='recipe_pulled_idx'),
+        ),
+    ]
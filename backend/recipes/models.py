@@ -1,8 +1,21 @@
+from collections import defaultdict
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, connections, models, transaction
+from django.db.models import (Case, Count, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, When, Window)
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.utils import timezone
 from django_extensions.validators import HexValidator
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from users.models import Follow
+from .storage import image_storage
+
 User = get_user_model()
 
 
@@ -11,6 +24,138 @@ MAX_LENGHT_COLOR = 7
 MIN_VALUE_VALID = 1
 MAX_VALUE_COOKING = 1440
 MAX_VALUE_AMOUNT = 10000
+SHOPPING_LIST_BATCH_SIZE = 1000
+TIMELINE_BATCH_SIZE = 1000
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Запросы к рецептам для отдачи через API."""
+
+    def with_related(self):
+        """Подгружает тэги и ингредиенты фиксированным числом запросов."""
+        return self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет признаки `is_favorited` и `is_in_shopping_cart`
+        для пользователя `user`."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(IsFavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def change_counter(self, field, delta):
+        """Атомарно изменяет счётчик `field` рецептов на `delta`."""
+        return self.update(**{field: Greatest(F(field) + delta, 0)})
+
+    def recount_counters(self):
+        """Пересчитывает `favorites_count` и `in_carts_count` одним
+        UPDATE."""
+        return self.update(
+            favorites_count=count_subquery(IsFavoriteRecipe),
+            in_carts_count=count_subquery(ShoppingCart),
+        )
+
+    def update_search_vector(self):
+        """Обновляет поисковый вектор рецептов (только PostgreSQL)."""
+        if connection.vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector(
+                'name', weight='A', config=settings.SEARCH_CONFIG
+            ) + SearchVector(
+                'text', weight='B', config=settings.SEARCH_CONFIG
+            )
+        ))
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Возвращает {id автора: [рецепты]} для нескольких авторов одним
+        запросом. С `limit` оставляет не больше `limit` последних рецептов
+        каждого автора по окну ROW_NUMBER()."""
+        queryset = self.filter(author__in=author_ids).only(
+            'id', 'name', 'image', 'cooking_time', 'author'
+        )
+        if limit is not None:
+            sql, params = queryset.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )).order_by().query.sql_with_params()
+            queryset = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                f'WHERE row_number <= %s ORDER BY row_number',
+                (*params, limit)
+            )
+        recipes = defaultdict(list)
+        for recipe in queryset:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+    def touch(self):
+        """Обновляет `updated_at`, не вызывая сигналов сохранения."""
+        return self.update(updated_at=timezone.now())
+
+    def for_user(self, user):
+        """Рецепты со всеми данными, нужными `RecipeSerializer`."""
+        return self.with_user_flags(user).with_related().select_related(
+            'author'
+        )
+
+
+def count_subquery(model):
+    """Подзапрос с числом строк `model`, ссылающихся на рецепт."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe'
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def delete_returning(model, returning, using='default', **values):
+    """Удаляет строки `model` одним DELETE ... RETURNING без сигналов.
+
+    `values` - условия {поле: значение или список значений}. Возвращает
+    значения поля `returning` удаленных строк.
+    """
+    meta = model._meta
+    quote = connections[using].ops.quote_name
+    conditions, params = [], []
+    for name, value in values.items():
+        column = quote(meta.get_field(name).column)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            if not value:
+                return []
+            conditions.append(
+                f'{column} IN ({", ".join(["%s"] * len(value))})'
+            )
+            params.extend(value)
+        else:
+            conditions.append(f'{column} = %s')
+            params.append(value)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {" AND ".join(conditions)} '
+            f'RETURNING {quote(meta.get_field(returning).column)}',
+            params
+        )
+        return [row[0] for row in cursor.fetchall()]
 
 
 class Recipe(models.Model):
@@ -27,12 +172,22 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Время публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Время изменения'
+    )
     image = models.ImageField(
         upload_to='recipes/images',
+        storage=image_storage,
         blank=True,
         null=True,
         verbose_name='Картинка'
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
     text = models.TextField(verbose_name='Текст рецепта')
     tags = models.ManyToManyField(
         'Tag',
@@ -50,9 +205,51 @@ class Recipe(models.Model):
             MaxValueValidator(MAX_VALUE_COOKING)
         ]
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в корзину'
+    )
+    similar_at = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Время расчета похожих рецептов'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    pushed = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан в ленты подписчиков'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_pulled_idx',
+                condition=Q(pushed=False)
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -122,6 +319,100 @@ class RecipeIngredient(models.Model):
             )
         ]
 
+    # Списки покупок поправляются здесь, а не в сигналах: при каскадном
+    # удалении рецепта строки состава удаляются без delete(), а корзины
+    # вычитают рецепт сами. Массовые операции вызывают
+    # `change_recipe_ingredients()` явно.
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old = RecipeIngredient.objects.filter(pk=self.pk).values_list(
+                'recipe_id', 'ingredient_id', 'amount'
+            ).first() if self.pk is not None else None
+            super().save(*args, **kwargs)
+            changes = defaultdict(lambda: ({}, {}))
+            if old is not None:
+                recipe_id, ingredient_id, amount = old
+                changes[recipe_id][0][ingredient_id] = amount
+            changes[self.recipe_id][1][self.ingredient_id] = self.amount
+            for recipe_id, (before, after) in changes.items():
+                ShoppingListItem.objects.change_recipe_ingredients(
+                    recipe_id, before, after
+                )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            ShoppingListItem.objects.change_recipe_ingredients(
+                self.recipe_id, {self.ingredient_id: self.amount}, {}
+            )
+        return result
+
+
+class UserRecipeQuerySet(models.QuerySet):
+    """Изменение связей пользователя с рецептами без лишних запросов."""
+
+    def add_recipe(self, user, recipe_id):
+        """Создает связь одной вставкой. Возвращает False, если связь уже
+        есть."""
+        return bool(self.add_recipes(user, [recipe_id]))
+
+    def remove_recipe(self, user, recipe_id):
+        """Удаляет связь одним DELETE. Возвращает False, если связи не
+        было."""
+        with transaction.atomic(using=self.db):
+            deleted = delete_returning(
+                self.model, 'recipe', self.db,
+                user=user.pk, recipe=recipe_id
+            )
+            if deleted:
+                self.model.recipes_changed(user.pk, deleted, -1)
+        return bool(deleted)
+
+    def add_recipes(self, user, recipe_ids):
+        """Добавляет связи с рецептами одной вставкой.
+
+        Уже существующие связи пропускаются через ON CONFLICT DO NOTHING,
+        а счетчики и список покупок меняются только для вставленных строк
+        из RETURNING. Возвращает id рецептов, связи с которыми добавлены.
+        """
+        if not recipe_ids:
+            return []
+        meta = self.model._meta
+        quote = connections[self.db].ops.quote_name
+        user_column = quote(meta.get_field('user').column)
+        recipe_column = quote(meta.get_field('recipe').column)
+        sql = (
+            f'INSERT INTO {quote(meta.db_table)} '
+            f'({user_column}, {recipe_column}) '
+            f'VALUES {", ".join(["(%s, %s)"] * len(recipe_ids))} '
+            f'ON CONFLICT ({user_column}, {recipe_column}) DO NOTHING '
+            f'RETURNING {recipe_column}'
+        )
+        params = [value for pk in recipe_ids for value in (user.pk, pk)]
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, params)
+                added = [row[0] for row in cursor.fetchall()]
+            if added:
+                self.model.recipes_changed(user.pk, added, 1)
+        return added
+
+    def remove_recipes(self, user, recipe_ids):
+        """Удаляет связи с рецептами одним DELETE ... RETURNING без
+        сигналов.
+
+        Счетчики и список покупок меняются только для удаленных строк.
+        Возвращает id рецептов, связи с которыми удалены.
+        """
+        with transaction.atomic(using=self.db):
+            removed = delete_returning(
+                self.model, 'recipe', self.db,
+                user=user.pk, recipe=list(recipe_ids)
+            )
+            if removed:
+                self.model.recipes_changed(user.pk, removed, -1)
+        return removed
+
 
 class UserRecipe(models.Model):
     """Абстрактная модель связи рецепт-пользователь."""
@@ -137,13 +428,27 @@ class UserRecipe(models.Model):
         verbose_name='Рецепт'
     )
 
+    counter_field = None
+
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def recipes_changed(cls, user_id, recipe_ids, sign):
+        """Обновляет данные, зависящие от связей пользователя с рецептами:
+        `sign=1` - связи добавлены, `sign=-1` - удаляются."""
+        Recipe.objects.filter(pk__in=recipe_ids).change_counter(
+            cls.counter_field, sign
+        )
+
 
 class IsFavoriteRecipe(UserRecipe):
     """Создает связь рецепт-избранное"""
 
+    counter_field = 'favorites_count'
+
     class Meta:
         default_related_name = 'is_favorite'
         verbose_name = 'Рецепт в избранном'
@@ -159,6 +464,8 @@ class IsFavoriteRecipe(UserRecipe):
 class ShoppingCart(UserRecipe):
     """Создает связь рецепт-список покупок"""
 
+    counter_field = 'in_carts_count'
+
     class Meta:
         default_related_name = 'in_shopping_cart'
         verbose_name = 'Рецепт в корзине'
@@ -169,3 +476,370 @@ class ShoppingCart(UserRecipe):
                 name='unique_isshoppingcart',
             )
         ]
+
+    @classmethod
+    def recipes_changed(cls, user_id, recipe_ids, sign):
+        super().recipes_changed(user_id, recipe_ids, sign)
+        ShoppingListItem.objects.change_recipes(user_id, recipe_ids, sign)
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """Поддержка сводного списка покупок в согласованном состоянии."""
+
+    def change_recipes(self, user_id, recipe_ids, sign):
+        """Прибавляет (`sign=1`) или вычитает (`sign=-1`) ингредиенты
+        рецептов из списка покупок пользователя."""
+        amounts = dict(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total'))
+        if not amounts:
+            return
+        with transaction.atomic():
+            if sign > 0:
+                self.bulk_create(
+                    [
+                        self.model(user_id=user_id, ingredient_id=pk)
+                        for pk in amounts
+                    ],
+                    ignore_conflicts=True
+                )
+            items = self.filter(user_id=user_id, ingredient_id__in=amounts)
+            items.update(amount=F('amount') + Case(
+                *[
+                    When(ingredient_id=pk, then=Value(sign * amount))
+                    for pk, amount in amounts.items()
+                ],
+                default=Value(0)
+            ))
+            if sign < 0:
+                items.filter(amount__lte=0).delete()
+
+    def rebuild(self, user_ids=None):
+        """Пересчитывает списки покупок пользователей по их корзинам."""
+        carts = ShoppingCart.objects.filter(
+            recipe__recipeingredient__isnull=False
+        )
+        items = self.all()
+        if user_ids is not None:
+            carts = carts.filter(user_id__in=user_ids)
+            items = items.filter(user_id__in=user_ids)
+        sums = carts.order_by().values(
+            'user_id', 'recipe__recipeingredient__ingredient_id'
+        ).annotate(amount=Sum('recipe__recipeingredient__amount'))
+        with transaction.atomic():
+            items.delete()
+            return len(self.bulk_create(
+                (
+                    self.model(
+                        user_id=row['user_id'],
+                        ingredient_id=row[
+                            'recipe__recipeingredient__ingredient_id'
+                        ],
+                        amount=row['amount']
+                    )
+                    for row in sums.iterator()
+                ),
+                batch_size=SHOPPING_LIST_BATCH_SIZE
+            ))
+
+    def change_recipe_ingredients(self, recipe_id, old, new):
+        """Переносит изменение состава рецепта в списки покупок всех,
+        у кого он в корзине.
+
+        `old` и `new` - словари {id ингредиента: количество} до и после
+        изменения; новые строки состава должны быть уже записаны. К каждому
+        затронутому ингредиенту прибавляется разница количеств, строки
+        для добавленных ингредиентов вставляются, обнулившиеся удаляются.
+        """
+        deltas = {
+            pk: new.get(pk, 0) - old.get(pk, 0)
+            for pk in old.keys() | new.keys()
+        }
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        added = [pk for pk in deltas if pk not in old]
+        users = ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values('user_id')
+        with transaction.atomic():
+            if added:
+                self.insert_for_carts(recipe_id, added)
+            items = self.filter(user_id__in=users, ingredient_id__in=deltas)
+            items.update(amount=F('amount') + Case(
+                *[
+                    When(ingredient_id=pk, then=Value(delta))
+                    for pk, delta in deltas.items()
+                ],
+                default=Value(0)
+            ))
+            if any(delta < 0 for delta in deltas.values()):
+                items.filter(amount__lte=0).delete()
+
+    def insert_for_carts(self, recipe_id, ingredient_ids):
+        """Заводит нулевые строки ингредиентов рецепта для всех, у кого он
+        в корзине, одним INSERT ... SELECT."""
+        quote = connections[self.db].ops.quote_name
+        placeholders = ', '.join(['%s'] * len(ingredient_ids))
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(user_id, ingredient_id, amount) '
+                f'SELECT cart.user_id, item.ingredient_id, 0 '
+                f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+                f'JOIN {quote(RecipeIngredient._meta.db_table)} item '
+                f'ON item.recipe_id = cart.recipe_id '
+                f'WHERE cart.recipe_id = %s '
+                f'AND item.ingredient_id IN ({placeholders}) '
+                f'ON CONFLICT (user_id, ingredient_id) DO NOTHING',
+                [recipe_id, *ingredient_ids]
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(default=0, verbose_name='Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shoppinglistitem',
+            )
+        ]
+
+
+def before(position, date_field, id_field):
+    """Условие для строк, идущих в ленте после позиции (дата, id)."""
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(
+        **{date_field: pub_date, f'{id_field}__lt': pk}
+    )
+
+
+class TimelineQuerySet(models.QuerySet):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Новый рецепт записывается в ленты подписчиков автора при публикации.
+    Рецепты авторов, у которых больше `FEED_PUSH_MAX_FOLLOWERS`
+    подписчиков, в ленты не пишутся и подмешиваются при чтении.
+    Решение запоминается в `Recipe.pushed`: подмешиваются неразосланные
+    рецепты, как бы потом ни менялось число подписчиков автора.
+    """
+
+    def is_pushed(self, author):
+        return author.followers_count <= settings.FEED_PUSH_MAX_FOLLOWERS
+
+    def push(self, recipe):
+        """Добавляет рецепт в ленты подписчиков автора."""
+        if not self.is_pushed(recipe.author):
+            return 0
+        Recipe.objects.filter(pk=recipe.pk).update(pushed=True)
+        recipe.pushed = True
+        followers = Follow.objects.filter(
+            following_id=recipe.author_id
+        ).values_list('user_id', flat=True).iterator()
+        created = 0
+        while True:
+            chunk = list(islice(followers, TIMELINE_BATCH_SIZE))
+            if not chunk:
+                return created
+            created += len(self.bulk_create(
+                (
+                    TimelineEntry(
+                        user_id=user_id, recipe_id=recipe.pk,
+                        author_id=recipe.author_id, pub_date=recipe.pub_date
+                    )
+                    for user_id in chunk
+                ),
+                ignore_conflicts=True
+            ))
+
+    def backfill(self, user_id, author):
+        """Добавляет в ленту последние разосланные рецепты автора после
+        подписки; остальные подмешиваются при чтении."""
+        recipes = Recipe.objects.filter(
+            author=author, pushed=True
+        ).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        return len(self.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author.pk, pub_date=pub_date
+                )
+                for recipe_id, pub_date in recipes
+            ),
+            ignore_conflicts=True,
+            batch_size=TIMELINE_BATCH_SIZE
+        ))
+
+    def trim(self, user_id, author_id):
+        """Убирает из ленты рецепты автора после отписки."""
+        return len(delete_returning(
+            self.model, 'id', self.db, user=user_id, author=author_id
+        ))
+
+    def page(self, user, limit, after=None):
+        """Возвращает до `limit` позиций ленты (дата, id рецепта),
+        следующих за позицией `after`."""
+        pushed = self.filter(
+            before(after, 'pub_date', 'recipe_id'), user=user
+        ).order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit]
+        pulled = Recipe.objects.filter(
+            before(after, 'pub_date', 'id'),
+            pushed=False,
+            author__in=Follow.objects.filter(user=user).values('following')
+        ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:limit]
+        positions = []
+        seen = set()
+        for position in merge(pushed, pulled, reverse=True):
+            if position[1] not in seen:
+                seen.add(position[1])
+                positions.append(position)
+                if len(positions) == limit:
+                    break
+        return positions
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Время публикации')
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        default_related_name = 'timeline'
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timelineentry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx',
+            ),
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Рецепт, похожий на данный по набору ингредиентов."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similarrecipe',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx',
+            ),
+        ]
+
+
+class CatalogVersionQuerySet(models.QuerySet):
+
+    def get_version(self, name):
+        """Возвращает текущую версию справочника `name`."""
+        return self.filter(name=name).values_list(
+            'version', flat=True
+        ).first() or 0
+
+    def bump(self, name):
+        """Увеличивает версию справочника `name` одним UPDATE."""
+        if not self.filter(name=name).update(version=F('version') + 1):
+            self.get_or_create(name=name, defaults={'version': 1})
+
+
+class CatalogVersion(models.Model):
+    """Версия справочника, общая для всех процессов.
+
+    Версия меняется в той же транзакции, что и данные, поэтому процесс,
+    увидевший новую версию, видит и новые данные.
+    """
+
+    name = models.CharField(
+        max_length=MAX_LENGHT,
+        unique=True,
+        verbose_name='Справочник'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+
+    objects = CatalogVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.version}'
@@ -0,0 +1,36 @@
+"""Построение уменьшенных копий картинок рецептов.
+
+Модуль выполняется в процессах пула из `recipes.images`, запущенных
+через spawn, поэтому не импортирует Django.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+
+def render(data, widths, quality):
+    """Строит уменьшенные копии картинки.
+
+    Выполняется в процессе пула, поэтому не обращается к Django.
+    Возвращает словарь {(формат, ширина): байты}.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    result = {}
+    for width in widths:
+        if image.width > width:
+            resized = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.LANCZOS
+            )
+        else:
+            resized = image
+        for key, (image_format, _) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(
+                buffer, image_format, quality=quality, optimize=True
+            )
+            result[key, width] = buffer.getvalue()
+    return result
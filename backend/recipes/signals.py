@@ -0,0 +1,60 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .images import enqueue, get_renditions
+from users.models import Follow
+from .models import (IsFavoriteRecipe, Recipe, RecipeIngredient, ShoppingCart,
+                     TimelineEntry)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        TimelineEntry.objects.push(instance)
+    if instance.image and not get_renditions(instance):
+        enqueue(instance)
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).touch()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif pk_set:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=IsFavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def user_recipe_created(sender, instance, created, **kwargs):
+    if created:
+        sender.recipes_changed(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=IsFavoriteRecipe)
+@receiver(pre_delete, sender=ShoppingCart)
+def user_recipe_deleted(sender, instance, **kwargs):
+    sender.recipes_changed(instance.user_id, [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.backfill(instance.user_id, instance.following)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    TimelineEntry.objects.trim(instance.user_id, instance.following_id)
@@ -0,0 +1,125 @@
+"""Похожие рецепты по пересечению ингредиентов.
+
+Рецепты - строки разреженной матрицы «рецепт x ингредиент» из
+`RecipeIngredient`. Матрица хранится построчно (множества ингредиентов
+рецептов) и по столбцам (списки рецептов с ингредиентом). Строка
+произведения A·Aᵀ для рецепта - число общих ингредиентов с каждым другим
+рецептом - собирается сложением столбцов его ингредиентов, из него
+считается сходство Жаккара или косинусное и берутся K лучших соседей.
+Рецепты обрабатываются порциями, в памяти держится только матрица
+и соседи текущей порции.
+"""
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+from math import sqrt
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import (Recipe, RecipeIngredient, SimilarRecipe,
+                     delete_returning)
+
+METRICS = ('jaccard', 'cosine')
+CHUNK_SIZE = 500
+
+
+class IngredientMatrix:
+    """Разреженная матрица «рецепт x ингредиент»."""
+
+    def __init__(self):
+        self.rows = defaultdict(set)
+        self.columns = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.order_by(
+        ).values_list('recipe_id', 'ingredient_id').iterator():
+            self.rows[recipe_id].add(ingredient_id)
+            self.columns[ingredient_id].append(recipe_id)
+        self.sizes = {
+            recipe_id: len(ingredients)
+            for recipe_id, ingredients in self.rows.items()
+        }
+
+    def neighbors(self, recipe_id, k, metric='jaccard'):
+        """Возвращает до `k` пар (сходство, id рецепта) по убыванию."""
+        ingredients = self.rows.get(recipe_id)
+        if not ingredients:
+            return []
+        common = Counter()
+        for ingredient_id in ingredients:
+            common.update(self.columns[ingredient_id])
+        del common[recipe_id]
+        size, sizes = len(ingredients), self.sizes
+        if metric == 'cosine':
+            scores = (
+                (count / sqrt(size * sizes[other]), other)
+                for other, count in common.items()
+            )
+        else:
+            scores = (
+                (count / (size + sizes[other] - count), other)
+                for other, count in common.items()
+            )
+        return heapq.nlargest(k, scores)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write(matrix, recipe_ids, k, metric, started, chunk_size, progress):
+    """Записывает соседей рецептов порциями, возвращает id всех соседей."""
+    neighbor_ids = set()
+    for chunk in chunks(recipe_ids, chunk_size):
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other, score=score)
+            for recipe_id in chunk
+            for score, other in matrix.neighbors(recipe_id, k, metric)
+        ]
+        with transaction.atomic():
+            delete_returning(SimilarRecipe, 'id', recipe=chunk)
+            SimilarRecipe.objects.bulk_create(rows)
+            Recipe.objects.filter(pk__in=chunk).update(similar_at=started)
+        neighbor_ids.update(row.similar_id for row in rows)
+        if progress:
+            progress(len(chunk), len(rows))
+    return neighbor_ids
+
+
+def build(k, metric='jaccard', chunk_size=CHUNK_SIZE, progress=None):
+    """Пересчитывает соседей всех рецептов."""
+    write(
+        IngredientMatrix(),
+        list(Recipe.objects.values_list('pk', flat=True)),
+        k, metric, timezone.now(), chunk_size, progress
+    )
+
+
+def refresh(k, metric='jaccard', chunk_size=CHUNK_SIZE, progress=None):
+    """Пересчитывает соседей рецептов, измененных после прошлого расчета.
+
+    Вместе с ними пересчитываются рецепты, у которых измененные были
+    среди соседей, и рецепты, ставшие соседями измененных. Рецепт,
+    в чей топ измененный рецепт вошел бы без взаимности, обновится при
+    следующем полном расчете.
+    """
+    started = timezone.now()
+    changed = set(Recipe.objects.filter(
+        Q(similar_at__isnull=True) | Q(updated_at__gt=F('similar_at'))
+    ).values_list('pk', flat=True))
+    if not changed:
+        return
+    stale = set(SimilarRecipe.objects.filter(
+        similar_id__in=changed
+    ).values_list('recipe_id', flat=True))
+    matrix = IngredientMatrix()
+    neighbor_ids = write(
+        matrix, sorted(changed), k, metric, started, chunk_size, progress
+    )
+    affected = (stale | neighbor_ids) - changed
+    write(matrix, sorted(affected), k, metric, started, chunk_size, progress)
@@ -0,0 +1,48 @@
+"""Хранилище картинок рецептов с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого:
+`recipes/images/ab/ab12...ef.jpg`. Повторная загрузка той же картинки
+не пишет файл заново и дает то же имя, поэтому одну запись на диске
+могут использовать несколько рецептов. Из-за этого файл нельзя удалять
+сразу, как только на него перестал ссылаться рецепт: другой рецепт мог
+только что получить то же имя и еще не зафиксировать транзакцию. Файлы
+без ссылок удаляет команда `cleanup_recipe_images`, не трогая файлы,
+измененные за последние `--grace` минут; повторное сохранение обновляет
+время изменения файла.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Сохраняет файлы под именем из хэша содержимого."""
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, file_name = posixpath.split(name)
+        extension = posixpath.splitext(file_name)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            # Файл уже есть: продлеваем ему срок до очистки.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,164 @@
+from django.test import TestCase
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem)
+from users.models import User
+
+
+class AddRecipesTest(TestCase):
+    """Пакетное добавление не учитывает уже существующие связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password',
+            first_name='Имя', last_name='Фамилия'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {index}', author=cls.user, text='Текст',
+                cooking_time=10
+            )
+            for index in range(2)
+        ]
+        for recipe in cls.recipes:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=10
+            )
+
+    def assertCart(self, carts_count, amount):
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].in_carts_count, carts_count)
+        self.assertEqual(
+            ShoppingListItem.objects.get(
+                user=self.user, ingredient=self.ingredient
+            ).amount,
+            amount
+        )
+
+    def test_existing_link_is_not_counted_again(self):
+        first, second = self.recipes
+        ShoppingCart.objects.add_recipe(self.user, first.pk)
+        self.assertCart(1, 10)
+
+        self.assertEqual(
+            ShoppingCart.objects.add_recipes(self.user, [first.pk]), []
+        )
+        self.assertCart(1, 10)
+
+        self.assertEqual(
+            ShoppingCart.objects.add_recipes(
+                self.user, [first.pk, second.pk]
+            ),
+            [second.pk]
+        )
+        self.assertCart(1, 20)
+
+    def test_missing_link_is_not_removed_again(self):
+        first, second = self.recipes
+        ShoppingCart.objects.add_recipes(self.user, [first.pk, second.pk])
+        self.assertEqual(
+            ShoppingCart.objects.remove_recipes(self.user, [second.pk]),
+            [second.pk]
+        )
+        self.assertEqual(
+            ShoppingCart.objects.remove_recipes(
+                self.user, [first.pk, second.pk]
+            ),
+            [first.pk]
+        )
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].in_carts_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class ChangeRecipeIngredientsTest(TestCase):
+    """Изменение состава рецепта переносится в списки покупок так же,
+    как при полном пересчете."""
+
+    def test_matches_rebuild(self):
+        users = [
+            User.objects.create_user(
+                email=f'user{index}@example.com', username=f'user{index}',
+                password='password', first_name='Имя', last_name='Фамилия'
+            )
+            for index in range(3)
+        ]
+        flour, sugar, salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль')
+        )
+        recipe, other = (
+            Recipe.objects.create(
+                name=name, author=users[0], text='Текст', cooking_time=10
+            )
+            for name in ('Пирог', 'Блины')
+        )
+        for item_recipe, ingredient, amount in (
+            (recipe, flour, 100), (recipe, sugar, 50), (other, sugar, 30),
+        ):
+            RecipeIngredient.objects.create(
+                recipe=item_recipe, ingredient=ingredient, amount=amount
+            )
+        for user in users[:2]:
+            ShoppingCart.objects.add_recipe(user, recipe.pk)
+        ShoppingCart.objects.add_recipe(users[1], other.pk)
+        ShoppingCart.objects.add_recipe(users[2], other.pk)
+
+        old = {flour.pk: 100, sugar.pk: 50}
+        new = {flour.pk: 150, salt.pk: 5}
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient=sugar
+        ).delete()
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient=flour
+        ).update(amount=150)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=5)
+        ])
+        ShoppingListItem.objects.change_recipe_ingredients(
+            recipe.pk, old, new
+        )
+
+        def snapshot():
+            return sorted(ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ))
+
+        maintained = snapshot()
+        ShoppingListItem.objects.rebuild()
+        self.assertEqual(maintained, snapshot())
+
+    def test_instance_save_and_delete(self):
+        user = User.objects.create_user(
+            email='user@example.com', username='user', password='password',
+            first_name='Имя', last_name='Фамилия'
+        )
+        flour, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар')
+        )
+        recipe = Recipe.objects.create(
+            name='Пирог', author=user, text='Текст', cooking_time=10
+        )
+        item = RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=flour, amount=100
+        )
+        ShoppingCart.objects.add_recipe(user, recipe.pk)
+
+        item.amount = 150
+        item.save()
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=sugar, amount=50
+        )
+        item.delete()
+
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(sugar.pk, 50)]
+        )
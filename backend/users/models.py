@@ -1,6 +1,25 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+
+class UserQuerySet(models.QuerySet):
+    """Запросы к пользователям для отдачи через API."""
+
+    def with_recipes_count(self):
+        """Добавляет `recipes_count` - число рецептов пользователя."""
+        return self.annotate(recipes_count=Count('recipes', distinct=True))
+
+    def change_followers_count(self, delta):
+        """Атомарно изменяет `followers_count` на `delta`."""
+        return self.update(
+            followers_count=Greatest(F('followers_count') + delta, 0)
+        )
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с запросами из `UserQuerySet`."""
 
 
 class User(AbstractUser):
@@ -11,9 +30,16 @@ class User(AbstractUser):
     is_subscribed = models.BooleanField(
         default=False,
     )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
 
+    objects = CustomUserManager()
+
     class Meta:
         ordering = ('username',)
         verbose_name = 'Пользователь'